@@ -0,0 +1,51 @@
+# many short words against one dfa: DFA.accept per word vs DenseDFA.accept per word vs DenseDFA.accept_many
+# vs DenseDFA.accept_vectorized (numpy, falls back to accept_many without it)
+# run from the repository root: python -m bench.bench_accept_many
+
+import random
+import time
+
+from src.Regex import parse_regex
+
+
+REGEX = '[a-zA-Z_][a-zA-Z_0-9]*@[a-z]+.[a-z]+'
+ALPHABET = 'abcxyzABC_09@.'
+WORDS = 200_000
+LENGTH = 12
+
+
+def main() -> None:
+    random.seed(0)
+    words = [''.join(random.choice(ALPHABET) for _ in range(random.randint(1, LENGTH))) for _ in range(WORDS)]
+    dfa = parse_regex(REGEX).thompson().subset_construction().minimize()
+    dfa.Tokens = {}
+
+    start = time.perf_counter()
+    expected = [dfa.accept(word) is not False for word in words]
+    loop_time = time.perf_counter() - start
+
+    compiled = dfa.compile()
+    start = time.perf_counter()
+    dense = [compiled.accept(word) for word in words]
+    dense_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = compiled.accept_many(words)
+    batch_time = time.perf_counter() - start
+
+    # the first call imports numpy
+    compiled.accept_vectorized(words[:10])
+    start = time.perf_counter()
+    vectorized = compiled.accept_vectorized(words)
+    vectorized_time = time.perf_counter() - start
+
+    assert dense == expected and list(map(bool, batch)) == expected and vectorized == batch
+    print(f'{WORDS} words, {sum(expected)} accepted')
+    print(f'{"DFA.accept loop":<28} {loop_time * 1000:>10.2f}ms')
+    print(f'{"DenseDFA.accept loop":<28} {dense_time * 1000:>10.2f}ms')
+    print(f'{"DenseDFA.accept_many":<28} {batch_time * 1000:>10.2f}ms')
+    print(f'{"DenseDFA.accept_vectorized":<28} {vectorized_time * 1000:>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# one-off matches of freshly built regexes: NFA.accept (set simulation) vs subset_construction().accept()
+# run from the repository root: python -m bench.bench_nfa_accept
+
+import random
+import time
+
+from src.Regex import parse_regex
+
+
+# the regexes of test/test_hw_2.py
+REGEXES = [
+    'a',
+    'ab',
+    'a | b',
+    'c(a | b)*',
+    '(ab | cd)*',
+    'c(a | b)?',
+    '[0-9]+',
+    '[a-z]+',
+    '[A-Z]+',
+    '(ab | cd+ | b*)? efg',
+    r'[a-z]*\ [a-z]*',
+    '(\n|[a-z])*',
+    '(a|(bb*a))(a|(bb*a))*',
+    '[A-Z]?([a-z]*[0-9])*',
+    '(a|b)*c(a|b)*c(a|b)*',
+    'a(b|c)(d|e)|abb|abc',
+    r'class\ ([A-Z][a-z]*)+\(([A-Z][a-z]*)*\):',
+    '(this_needs_to_match_a_really_long_string_or_nothing)?',
+    '([A-Z]|[a-z]|[0-9])+@[a-z]+.[a-z]+',
+    '((-|.)(-|.)(-|.))|(.(-|.)(--|-.|..))|(-(-.|..|.-)(-|.))',
+    r'((((-|.)(-|.)(-|.))|(.(-|.)(--|-.|..))|(-(-.|..|.-)(-|.)))\ )+',
+    r'([a-z]+\ )+vrea\ sa(\ [a-z]+)+',
+    '[a-z]+([A-Z][a-z]+)*',
+    r'[0-9]+((\+|-)[0-9]+)*',
+    r'\/\*([A-Z]|[a-z]|[0-9]|\ )*\*\/',
+]
+
+WORDS = 5
+LENGTH = 40
+
+
+def main() -> None:
+    random.seed(0)
+    print(f'{"regex":<60} {"nfa.accept":>12} {"dfa.accept":>12}')
+
+    total_nfa = 0.0
+    total_dfa = 0.0
+    for regex in REGEXES:
+        alphabet = sorted(parse_regex(regex).thompson().S)
+        words = [''.join(random.choice(alphabet) for _ in range(LENGTH)) for _ in range(WORDS)]
+
+        # both sides start from a freshly built nfa, like a one-off match would
+        start = time.perf_counter()
+        nfa = parse_regex(regex).thompson()
+        nfa_results = [nfa.accept(word) for word in words]
+        nfa_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        dfa = parse_regex(regex).thompson().subset_construction()
+        dfa_results = [bool(dfa.accept(word)) for word in words]
+        dfa_time = time.perf_counter() - start
+
+        assert nfa_results == dfa_results, regex
+        total_nfa += nfa_time
+        total_dfa += dfa_time
+        print(f'{regex[:58]!r:<60} {nfa_time * 1000:>10.2f}ms {dfa_time * 1000:>10.2f}ms')
+
+    print(f'{"total":<60} {total_nfa * 1000:>10.2f}ms {total_dfa * 1000:>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,76 @@
-from collections.abc import Callable
+from .DenseDFA import DenseDFA
+from array import array
+from collections.abc import Callable, Iterable, Sequence
 from dataclasses import dataclass
 from itertools import product
-import pandas as pd
 from typing import TypeVar
 from functools import reduce
 from collections import deque
 from typing import Optional
+from sys import intern
 
 STATE = TypeVar('STATE')
 
+
+# the text format of tests_1 and tests_2:
+# #states, #initial, #accepting, #alphabet and #transitions, each followed by one entry per line
+# a transition is written as state:symbol>next_state, a few symbols are escaped (a space is \\)
+SYMBOL_ESCAPES = {'\n': '\\n', '\t': '\\t', ' ': '\\\\'}
+SYMBOL_UNESCAPES = {escaped: symbol for symbol, escaped in SYMBOL_ESCAPES.items()}
+SECTIONS = ('#states', '#initial', '#accepting', '#alphabet', '#transitions')
+
+
+def read_automaton(path: str) -> tuple[list[str], str, list[str], list[str], list[tuple[str, str, str]]]:
+    # the states, initial state, accepting states, alphabet and (state, symbol, next state) transitions of a file
+    # the file is read at once and split by the section headers, the state names are interned
+    with open(path, 'r') as f:
+        data = f.read()
+
+    lines = data.split('\n')
+    starts = []
+    i = 0
+    for section in SECTIONS:
+        try:
+            i = lines.index(section, i)
+        except ValueError:
+            raise ValueError(f'invalid file format, missing {section}') from None
+        starts.append(i)
+    starts.append(len(lines))
+
+    blocks = [lines[starts[k] + 1:starts[k + 1]] for k in range(len(SECTIONS))]
+    states_block, initial_block, accepting_block, alphabet_block, transitions_block = blocks
+
+    states = [intern(state.strip()) for state in states_block if state.strip()]
+    initial = [intern(state.strip()) for state in initial_block if state.strip()]
+    if len(initial) != 1:
+        raise ValueError('invalid file format, there must be one initial state')
+    accepting = [intern(state.strip()) for state in accepting_block if state.strip()]
+    alphabet = [SYMBOL_UNESCAPES.get(symbol, symbol) for symbol in alphabet_block if symbol]
+
+    # the state names contain neither ':' nor '>', but the symbols might
+    transitions = []
+    for line in transitions_block:
+        line = line.strip('\r')
+        if not line:
+            continue
+        left, _, next_state = line.rpartition('>')
+        state, _, symbol = left.partition(':')
+        transitions.append((intern(state), SYMBOL_UNESCAPES.get(symbol, symbol), intern(next_state)))
+
+    return states, initial[0], accepting, alphabet, transitions
+
+
+def write_automaton(path: str, states, initial, accepting, alphabet, transitions) -> None:
+    # the inverse of read_automaton, the states are written with str
+    lines = ['#states', *map(str, states), '#initial', str(initial), '#accepting', *map(str, accepting), '#alphabet']
+    lines.extend(SYMBOL_ESCAPES.get(symbol, symbol) for symbol in alphabet)
+    lines.append('#transitions')
+    lines.extend(f'{state}:{SYMBOL_ESCAPES.get(symbol, symbol)}>{next_state}' for state, symbol, next_state in transitions)
+
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+        f.write('\n')
+
 @dataclass
 class DFA[STATE]:
     S: set[str]
@@ -45,9 +107,114 @@ class DFA[STATE]:
             return current_state
         return False
         return current_state in self.F
-    
-    
-    def minimize(self) -> 'DFA[STATE]':
+
+    @staticmethod
+    def load(path: str, dense: bool = False) -> 'DFA[str] | DenseDFA':
+        # read a dfa in the text format of tests_1 / tests_2, the states are their names
+        # with dense=True the compiled form (see compile) is built right away, without the dicts of a DFA
+        states, initial, accepting, alphabet, transitions = read_automaton(path)
+        if not dense:
+            # the format has no tokens
+            d = {(state, symbol): next_state for state, symbol, next_state in transitions}
+            return DFA(set(alphabet), set(states), initial, d, set(accepting), {})
+
+        # the initial state is 0
+        index = {initial: 0}
+        for state in states:
+            index.setdefault(state, len(index))
+        for state, _, next_state in transitions:
+            index.setdefault(state, len(index))
+            index.setdefault(next_state, len(index))
+        size = len(index)
+
+        symbols = sorted(set(alphabet) | {symbol for _, symbol, _ in transitions})
+        symbol_idx = {symbol: c for c, symbol in enumerate(symbols)}
+        width = len(symbols)
+
+        table = array('i', [-1]) * (size * width)
+        for state, symbol, next_state in transitions:
+            table[index[state] * width + symbol_idx[symbol]] = index[next_state]
+
+        final = bytearray(size)
+        for state in accepting:
+            final[index[state]] = 1
+
+        return DenseDFA.from_table(symbols, size, table, final, [None] * size)
+
+    def dump(self, path: str) -> None:
+        # write the dfa in the text format of tests_1 / tests_2, the states are written with str
+        symbols = sorted(self.S)
+        transitions = [(state, symbol, next_state) for (state, symbol), next_state in self.d.items()]
+        write_automaton(path, self.K, self.q0, self.F, symbols, transitions)
+
+    def accept_many(self, words: Iterable[str], tokens: bool = False) -> bytearray | list[Optional[str]]:
+        # accept for a batch of words: the dfa is compiled once and the words run against the table,
+        # see DenseDFA.accept_many for the result
+        return self.compile().accept_many(words, tokens)
+
+    def accept_vectorized(self, words: Sequence[str], tokens: bool = False) -> bytearray | list[Optional[str]]:
+        # accept_many with the optional numpy backend, see DenseDFA.accept_vectorized
+        return self.compile().accept_vectorized(words, tokens)
+
+    def symbol_classes(self) -> dict[str, int]:
+        # symbols that lead every state to the same place can't be told apart: number these classes 0..C-1 and
+        # map every symbol to its class
+        states = list(self.K)
+        signatures = {}
+        classes = {}
+        for symbol in sorted(self.S):
+            signature = tuple(self.d.get((state, symbol)) for state in states)
+            classes[symbol] = signatures.setdefault(signature, len(signatures))
+        return classes
+
+    def compile(self) -> DenseDFA:
+        # renumber the states to 0..N-1 and store the transitions in a flat integer table, the initial state is
+        # always 0 (see DenseDFA.from_table for the dead states and the symbol classes)
+        states = [self.q0] + [state for state in self.K if state != self.q0]
+        state_to_idx = {state: i for i, state in enumerate(states)}
+
+        symbols = sorted(self.S)
+        symbol_idx = {symbol: c for c, symbol in enumerate(symbols)}
+        width = len(symbols)
+
+        table = array('i', [-1]) * (len(states) * width)
+        for (state, symbol), dest_state in self.d.items():
+            if state in state_to_idx and dest_state in state_to_idx:
+                table[state_to_idx[state] * width + symbol_idx[symbol]] = state_to_idx[dest_state]
+
+        Tokens = self.Tokens or {}
+        final = bytes(1 if state in self.F else 0 for state in states)
+        tokens = [Tokens.get(state) for state in states]
+
+        return DenseDFA.from_table(symbols, len(states), table, final, tokens)
+
+    @staticmethod
+    def from_dense(dense: DenseDFA) -> 'DFA[int]':
+        # the inverse of compile: states 0..size-1 and, if some transition is missing, the sink state size
+        symbols = sorted(dense.columns)
+        sink = dense.size
+
+        d = {}
+        for state in range(dense.size):
+            row = state * dense.width
+            for symbol in symbols:
+                dest_state = dense.table[row + dense.columns[symbol]]
+                d[(state, symbol)] = dest_state if dest_state >= 0 else sink
+
+        K = set(range(dense.size))
+        if sink in d.values() or dense.size == 0:
+            K.add(sink)
+            for symbol in symbols:
+                d[(sink, symbol)] = sink
+
+        F = {state for state in range(dense.size) if dense.final[state]}
+        Tokens = {state: dense.tokens[state] for state in F if dense.tokens[state] is not None}
+        return DFA(set(symbols), K, 0, d, F, Tokens)
+
+    def table_filling_groups(self) -> dict[STATE, STATE]:
+        # the table filling algorithm, O(N^2), kept as a reference for hopcroft_groups
+        # maps every state to the main state of its group
+
         # get the predecessors of each state
         inversed_d = {}
         for key, value in self.d.items():
@@ -74,10 +241,13 @@ class DFA[STATE]:
                 row.append(0)
             matrix.append(row)
 
+        # states that end different tokens are distinguishable as well
+        tokens = self.Tokens or {}
+
         # base case
         for i in range(1, N):
             for j in range(i):
-                if (states[i] in self.F) != (states[j] in self.F):
+                if (states[i] in self.F) != (states[j] in self.F) or tokens.get(states[i]) != tokens.get(states[j]):
                     matrix[i][j] = 1
                     queue.append((i, j))
 
@@ -142,6 +312,88 @@ class DFA[STATE]:
             if state not in main_state:
                 main_state[state] = state
 
+        return main_state
+
+    def hopcroft_groups(self) -> dict[STATE, STATE]:
+        # hopcroft's partition refinement, O(N * C * log N) for C classes of symbols
+        # maps every state to the main state of its group
+        states = list(self.K)
+        N = len(states)
+        state_to_idx = {state: i for i, state in enumerate(states)}
+        # one symbol of each class is enough, the others have the same transitions
+        symbols = list({c: symbol for symbol, c in self.symbol_classes().items()}.values())
+
+        # get the predecessors of each state for every symbol
+        # a missing transition goes to an extra dead state (index N)
+        inversed_d = [[[] for _ in range(N + 1)] for _ in symbols]
+        for c, symbol in enumerate(symbols):
+            inversed_d[c][N].append(N)
+            for i, state in enumerate(states):
+                dest_state = self.d.get((state, symbol))
+                dest = state_to_idx.get(dest_state, N) if dest_state is not None else N
+                inversed_d[c][dest].append(i)
+
+        # initial partition: the final states of every token and the rest
+        tokens = self.Tokens or {}
+        labels = {}
+        for i, state in enumerate(states):
+            labels.setdefault((state in self.F, tokens.get(state)), set()).add(i)
+        labels.setdefault((False, None), set()).add(N)
+
+        blocks = list(labels.values())
+        block_of = [0] * (N + 1)
+        for b, block in enumerate(blocks):
+            for i in block:
+                block_of[i] = b
+
+        worklist = set(range(len(blocks)))
+
+        while worklist:
+            splitter = list(blocks[worklist.pop()])
+
+            for c in range(len(symbols)):
+                # group the predecessors of the splitter by their block
+                touched = {}
+                for dest in splitter:
+                    for i in inversed_d[c][dest]:
+                        touched.setdefault(block_of[i], set()).add(i)
+
+                for b, inside in touched.items():
+                    if len(inside) == len(blocks[b]):
+                        continue
+
+                    # split the block, the states that go into the splitter get a new block
+                    blocks[b] -= inside
+                    blocks.append(inside)
+                    new_b = len(blocks) - 1
+                    for i in inside:
+                        block_of[i] = new_b
+
+                    # it's enough to process the smaller half if the block isn't already waiting
+                    if b in worklist or len(inside) <= len(blocks[b]):
+                        worklist.add(new_b)
+                    else:
+                        worklist.add(b)
+
+        # assign a main value for the group
+        main_state = {}
+        for block in blocks:
+            block = sorted(i for i in block if i != N)
+            for i in block:
+                main_state[states[i]] = states[block[0]]
+
+        return main_state
+
+    def minimize(self, algorithm: str = 'hopcroft') -> 'DFA[STATE]':
+        # merge the states that can't be distinguished
+        # algorithm is 'hopcroft' or 'table' (the old table filling algorithm, slower, kept for testing)
+        if algorithm == 'hopcroft':
+            main_state = self.hopcroft_groups()
+        elif algorithm == 'table':
+            main_state = self.table_filling_groups()
+        else:
+            raise ValueError(f'unknown minimization algorithm {algorithm}')
+
         new_dfa_S = self.S
         new_dfa_K = set()
         new_dfa_d = {}
@@ -164,5 +416,10 @@ class DFA[STATE]:
             new_dfa_K.add(src_state)
             new_dfa_K.add(rep_dest_state)
 
-        return DFA(new_dfa_S, new_dfa_K, new_dfa_q0, new_dfa_d, new_dfa_F)
+        # keep the tokens, every state of a group has the same one
+        new_dfa_Tokens = None
+        if self.Tokens is not None:
+            new_dfa_Tokens = {main_state.get(state): token for state, token in self.Tokens.items()}
+
+        return DFA(new_dfa_S, new_dfa_K, new_dfa_q0, new_dfa_d, new_dfa_F, new_dfa_Tokens)
         
\ No newline at end of file
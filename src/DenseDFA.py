@@ -0,0 +1,483 @@
+from array import array
+from collections.abc import Iterable, Iterator, Sequence
+from dataclasses import dataclass, field
+from typing import Optional
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+
+# binary format of a DenseDFA (see to_bytes), bump FORMAT_VERSION whenever it changes
+MAGIC = b'LPDF'
+FORMAT_VERSION = 1
+# magic, format version, size, width, number of symbols, number of token names
+HEADER = struct.Struct('<4sIIIII')
+
+
+def little_endian(values: array) -> bytes:
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_little_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+@dataclass
+class DenseDFA:
+    # compiled form of a DFA: the states are renumbered to 0..size-1 (0 is the initial state),
+    # columns maps every symbol to its class (see from_table) and the transitions live in one flat table
+    # of ints with a column per class, table[state * width + column] is the next state or -1 when no final state
+    # can be reached anymore
+    columns: dict[str, int]
+    width: int
+    size: int
+    table: array | memoryview
+    final: bytes | memoryview
+    tokens: Sequence[Optional[str]]
+
+    # the states that go to a state on a column are predecessors[starts[i]:starts[i + 1]], i = column * size + state,
+    # as many as there are transitions. and the steps of the reversed dfa taken so far (see prefix_starts)
+    predecessor_starts: Optional[array] = field(default=None, init=False, repr=False, compare=False)
+    predecessors: Optional[array] = field(default=None, init=False, repr=False, compare=False)
+    reversed_steps: dict[tuple[Optional[tuple[int, ...]], int], tuple[int, ...]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    # the column of every byte and the dfa over the bytes of the utf-8 encoding, see byte_columns and utf8
+    byte_table: Optional[list[int]] = field(default=None, init=False, repr=False, compare=False)
+    utf8_dfa: Optional['DenseDFA'] = field(default=None, init=False, repr=False, compare=False)
+
+    def run(self, word: str, state: int = 0) -> int:
+        # the state reached after reading the word, -1 if the word can't be accepted anymore
+        columns = self.columns
+        table = self.table
+        width = self.width
+
+        for symbol in word:
+            column = columns.get(symbol)
+            if column is None:
+                return -1
+
+            state = table[state * width + column]
+            if state < 0:
+                return -1
+
+        return state
+
+    def accept(self, word: str) -> bool:
+        state = self.run(word)
+        return state >= 0 and self.final[state] == 1
+
+    def accept_many(self, words: Iterable[str], tokens: bool = False) -> bytearray | list[Optional[str]]:
+        # run every word, the result has one entry per word: 1 / 0 for accepted / rejected or, with tokens=True,
+        # the token of the final state reached (None for rejected words and final states without a token)
+        columns = self.columns
+        width = self.width
+        final = self.final
+        state_tokens = self.tokens
+
+        # the table with every next state multiplied by the width, so a step is a single lookup
+        offsets = array('i', [state * width if state >= 0 else -1 for state in self.table])
+
+        results = [] if tokens else bytearray()
+        append = results.append
+        for word in words:
+            row = 0
+            for symbol in word:
+                column = columns.get(symbol)
+                if column is None:
+                    row = -1
+                    break
+
+                row = offsets[row + column]
+                if row < 0:
+                    break
+
+            if row < 0:
+                append(None if tokens else 0)
+            elif tokens:
+                state = row // width if width else 0
+                append(state_tokens[state] if final[state] else None)
+            else:
+                append(final[row // width if width else 0])
+
+        return results
+
+    def accept_vectorized(self, words: Sequence[str], tokens: bool = False) -> bytearray | list[Optional[str]]:
+        # accept_many with numpy (optional, pip install numpy): the words are grouped by length and every group
+        # advances a vector of states one column at a time, with a single table lookup for the whole group
+        # same result as accept_many, which is also used when numpy isn't installed
+        try:
+            import numpy as np
+        except ImportError:
+            return self.accept_many(words, tokens)
+
+        # an extra dead state (size) with an extra column for the symbols outside the alphabet, both lead to it
+        dead = self.size
+        table = np.full((self.size + 1, self.width + 1), dead, dtype=np.int32)
+        table[:self.size, :self.width] = np.asarray(self.table, dtype=np.int32).reshape(self.size, self.width)
+        table[table < 0] = dead
+
+        # the class of every code point up to the largest one of the alphabet, the next one stands for all the others
+        top = max(map(ord, self.columns), default=0) + 1
+        classes = np.full(top + 1, self.width, dtype=np.int32)
+        for symbol, column in self.columns.items():
+            classes[ord(symbol)] = column
+
+        final = np.zeros(self.size + 1, dtype=np.uint8)
+        final[:self.size] = np.frombuffer(bytes(self.final), dtype=np.uint8)
+
+        # the token of a state as an index in names, 0 (None) for the states that don't end a token
+        names = [None] + sorted({token for token in self.tokens if token is not None})
+        name_ids = {name: i for i, name in enumerate(names)}
+        token_ids = np.zeros(self.size + 1, dtype=np.int32)
+        token_ids[:self.size] = [name_ids[token] if final[state] else 0 for state, token in enumerate(self.tokens)]
+
+        # every code point of every word in one array, the words of each length are gathered into a matrix
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        starts = np.cumsum(lengths) - lengths
+        codes = np.frombuffer(''.join(words).encode('utf-32-le'), dtype='<u4')
+        columns = classes[np.minimum(codes, top)]
+
+        states = np.zeros(len(words), dtype=np.int32)
+        for length in np.unique(lengths).tolist():
+            if not length:
+                continue
+
+            indexes = np.flatnonzero(lengths == length)
+            group_columns = columns[starts[indexes][:, None] + np.arange(length)]
+
+            group_states = np.zeros(len(indexes), dtype=np.int32)
+            for j in range(length):
+                group_states = table[group_states, group_columns[:, j]]
+            states[indexes] = group_states
+
+        if tokens:
+            return [names[i] for i in token_ids[states].tolist()]
+        return bytearray(final[states].tobytes())
+
+    def longest_match(self, word: str, start: int = 0) -> tuple[int, Optional[str]]:
+        # end index and token of the longest accepted (non empty) prefix of word[start:], (-1, None) if there is none
+        columns = self.columns
+        table = self.table
+        width = self.width
+        final = self.final
+
+        state = 0
+        end = -1
+        token = None
+
+        for j in range(start, len(word)):
+            column = columns.get(word[j])
+            if column is None:
+                break
+
+            state = table[state * width + column]
+            if state < 0:
+                break
+
+            if final[state]:
+                end = j + 1
+                token = self.tokens[state]
+
+        return end, token
+
+    def scan(self, word: str, start: int = 0) -> tuple[int, Optional[str], bool]:
+        # longest_match, plus whether the dfa could still go on at the end of the word: the longest match of a
+        # longer word (with the same prefix) might be longer
+        columns = self.columns
+        table = self.table
+        width = self.width
+        final = self.final
+
+        state = 0
+        end = -1
+        token = None
+
+        for j in range(start, len(word)):
+            column = columns.get(word[j])
+            if column is None:
+                return end, token, False
+
+            state = table[state * width + column]
+            if state < 0:
+                return end, token, False
+
+            if final[state]:
+                end = j + 1
+                token = self.tokens[state]
+
+        return end, token, True
+
+    def byte_columns(self) -> list[int]:
+        # the column of each of the 256 bytes, -1 for the ones outside of the alphabet
+        # (the symbols of a dfa over bytes are chr(byte), see utf8)
+        if self.byte_table is None:
+            self.byte_table = [self.columns.get(chr(byte), -1) for byte in range(256)]
+        return self.byte_table
+
+    def utf8(self) -> 'DenseDFA':
+        # the same dfa over the bytes of the utf-8 encoding of the symbols: the encoding of a symbol of more than one
+        # byte goes through new states, one per state and prefix of the encoding. the symbols of the result are the
+        # bytes as chr(byte), a match always ends after a whole character
+        if self.utf8_dfa is None:
+            encodings = []
+            for symbol, column in self.columns.items():
+                try:
+                    encodings.append((symbol.encode('utf-8'), column))
+                except UnicodeEncodeError:
+                    # a lone surrogate can't be in utf-8 text
+                    pass
+            symbols = [chr(byte) for byte in sorted({byte for encoded, _ in encodings for byte in encoded})]
+            byte_idx = {ord(symbol): c for c, symbol in enumerate(symbols)}
+            width = len(symbols)
+
+            size = self.size
+            table = array('i', [-1]) * (size * width)
+            final = bytearray(self.final)
+            tokens = list(self.tokens)
+            prefixes = {}
+            for state in range(self.size):
+                for encoded, column in encodings:
+                    dest = self.table[state * self.width + column]
+                    if dest < 0:
+                        continue
+
+                    current = state
+                    for k in range(len(encoded) - 1):
+                        next_state = prefixes.get((state, encoded[:k + 1]))
+                        if next_state is None:
+                            next_state = prefixes[(state, encoded[:k + 1])] = size
+                            size = size + 1
+                            table.extend(array('i', [-1]) * width)
+                            final.append(0)
+                            tokens.append(None)
+                        table[current * width + byte_idx[encoded[k]]] = next_state
+                        current = next_state
+                    table[current * width + byte_idx[encoded[-1]]] = dest
+
+            self.utf8_dfa = DenseDFA.from_table(symbols, size, table, final, tokens)
+        return self.utf8_dfa
+
+    def build_predecessors(self) -> None:
+        # the transitions sorted by column and destination, counted first
+        size = self.size
+        width = self.width
+        table = self.table
+        starts = array('q', bytes(8 * (width * size + 1)))
+        for state in range(size):
+            for column in range(width):
+                next_state = table[state * width + column]
+                if next_state >= 0:
+                    starts[column * size + next_state + 1] += 1
+        for i in range(width * size):
+            starts[i + 1] += starts[i]
+
+        predecessors = array('i', bytes(4 * starts[-1]))
+        filled = array('q', starts)
+        for state in range(size):
+            for column in range(width):
+                next_state = table[state * width + column]
+                if next_state >= 0:
+                    i = column * size + next_state
+                    predecessors[filled[i]] = state
+                    filled[i] += 1
+
+        self.predecessor_starts = starts
+        self.predecessors = predecessors
+
+    def prefix_starts(self, word: str, end: int) -> Iterator[int]:
+        # the positions s <= end, going back from end, from which a scan reaches end: the dfa doesn't die reading
+        # word[s:end]. word is read backwards by the reversed dfa, its state is the sorted tuple of the states from
+        # which the characters read so far can be read (None for all of them), and it stops when that is empty
+        if self.predecessors is None:
+            self.build_predecessors()
+        starts = self.predecessor_starts
+        predecessors = self.predecessors
+        size = self.size
+
+        # a cache of at most as many reversed steps as there are table entries
+        steps = self.reversed_steps
+        if len(steps) > max(size * self.width, 4096):
+            steps.clear()
+
+        yield end
+        states = None
+        for s in range(end - 1, -1, -1):
+            column = self.columns.get(word[s])
+            if column is None:
+                return
+
+            key = (states, column)
+            if key not in steps:
+                result = set()
+                base = column * size
+                for state in range(size) if states is None else states:
+                    result.update(predecessors[starts[base + state]:starts[base + state + 1]])
+                steps[key] = tuple(sorted(result))
+            states = steps[key]
+
+            if not states:
+                return
+            if states[0] == 0:
+                yield s
+
+    @classmethod
+    def from_table(cls, symbols: Sequence[str], size: int, table: array, final: bytes | bytearray, tokens: Sequence[Optional[str]]) -> 'DenseDFA':
+        # build a DenseDFA from a table with a column per symbol (-1 where there's no transition), 0 is the initial
+        # state. the states from which no final state can be reached are dropped (but 0), the transitions to them
+        # become -1. then the symbols that lead every state to the same place share a column
+        width = len(symbols)
+        inversed_d = [[] for _ in range(size)]
+        for i in range(size):
+            for dest in table[i * width:(i + 1) * width]:
+                if dest >= 0:
+                    inversed_d[dest].append(i)
+
+        # go backwards from the final states
+        alive = bytearray(size)
+        queue = [i for i in range(size) if final[i]]
+        for i in queue:
+            alive[i] = 1
+        while queue:
+            for i in inversed_d[queue.pop()]:
+                if not alive[i]:
+                    alive[i] = 1
+                    queue.append(i)
+
+        keep = [i for i in range(size) if alive[i] or i == 0]
+        new_idx = array('i', [-1]) * size
+        for k, i in enumerate(keep):
+            new_idx[i] = k
+        rows = [[new_idx[dest] if dest >= 0 else -1 for dest in table[i * width:(i + 1) * width]] for i in keep]
+
+        # one column per class of symbols
+        signatures = {}
+        columns = {}
+        representatives = []
+        for c, symbol in enumerate(symbols):
+            signature = tuple(row[c] for row in rows)
+            if signature not in signatures:
+                signatures[signature] = len(signatures)
+                representatives.append(c)
+            columns[symbol] = signatures[signature]
+
+        new_table = array('i', [row[c] for row in rows for c in representatives])
+        return cls(columns, len(representatives), len(keep), new_table, bytes(final[i] for i in keep), [tokens[i] for i in keep])
+
+    def to_bytes(self) -> bytes:
+        # header, the code point and class of every symbol, the table, the token of every state (0 for none,
+        # i + 1 for names[i]), the final flags and at last the token names (length + utf-8)
+        # every number is a little endian 32 bit int
+        symbols = sorted(self.columns)
+        names = sorted({token for token in self.tokens if token is not None})
+        name_ids = {name: i + 1 for i, name in enumerate(names)}
+
+        parts = [
+            HEADER.pack(MAGIC, FORMAT_VERSION, self.size, self.width, len(symbols), len(names)),
+            little_endian(array('I', [ord(symbol) for symbol in symbols])),
+            little_endian(array('I', [self.columns[symbol] for symbol in symbols])),
+            little_endian(array('i', self.table)),
+            little_endian(array('I', [name_ids.get(token, 0) for token in self.tokens])),
+            bytes(self.final),
+        ]
+        for name in names:
+            encoded = name.encode('utf-8')
+            parts.append(struct.pack('<I', len(encoded)))
+            parts.append(encoded)
+
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'DenseDFA':
+        # the inverse of to_bytes, raises ValueError if data isn't a DenseDFA of this format version
+        return cls.from_buffer(data, copy=True)
+
+    @classmethod
+    def from_buffer(cls, data: bytes | memoryview | mmap.mmap, copy: bool = False) -> 'DenseDFA':
+        # read the format of to_bytes, the table, final flags and token ids are views of data unless copy is set
+        # (or the machine is big endian), only the symbol classes and token names are turned into python objects
+        # every state and column is range checked (a pass over the table), so a damaged file is a ValueError and
+        # never a bad index while matching
+        if len(data) < HEADER.size:
+            raise ValueError('truncated dfa data')
+        magic, version, size, width, symbols_count, names_count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f'not a dfa of format version {FORMAT_VERSION}')
+
+        # the 32 bit arrays and where they end, every one of them starts at a multiple of 4
+        view = memoryview(data)
+        offset = HEADER.size
+        sections = []
+        for typecode, length in (('I', symbols_count), ('I', symbols_count), ('i', size * width), ('I', size)):
+            end = offset + 4 * length
+            if end > len(view):
+                raise ValueError('truncated dfa data')
+            if copy or sys.byteorder == 'big':
+                sections.append(from_little_endian(typecode, view[offset:end]))
+            else:
+                sections.append(view[offset:end].cast(typecode))
+            offset = end
+        symbols, classes, table, token_ids = sections
+
+        final = bytes(view[offset:offset + size]) if copy else view[offset:offset + size]
+        offset = offset + size
+
+        names = [None]
+        for _ in range(names_count):
+            if offset + 4 > len(view):
+                raise ValueError('truncated dfa data')
+            (length,) = struct.unpack_from('<I', view, offset)
+            names.append(bytes(view[offset + 4:offset + 4 + length]).decode('utf-8'))
+            offset = offset + 4 + length
+        if len(final) != size or offset > len(view):
+            raise ValueError('truncated dfa data')
+        if max(token_ids, default=0) > names_count:
+            raise ValueError('corrupted dfa data')
+        if not -1 <= min(table, default=-1) <= max(table, default=-1) < size:
+            raise ValueError('corrupted dfa data')
+        if max(classes, default=0) >= max(width, 1):
+            raise ValueError('corrupted dfa data')
+
+        columns = {chr(symbol): c for symbol, c in zip(symbols, classes)}
+        tokens = [names[i] for i in token_ids] if copy else TokenTable(token_ids, names)
+        return cls(columns, width, size, table, final, tokens)
+
+    def dump(self, path: str) -> None:
+        # written to a temporary file next to path and renamed over it: a process that mapped the old file (see open)
+        # keeps reading it whole, the others never see half of the new one
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.to_bytes())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def open(cls, path: str) -> 'DenseDFA':
+        # map a file written by dump (or a lexer cache) read only and match against it directly: every process that
+        # opens the same file shares one copy of the table in the page cache
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.from_buffer(mapped)
+
+
+@dataclass
+class TokenTable(Sequence):
+    # the token of every state of a mapped DenseDFA, an index into names (names[0] is None) per state
+    ids: memoryview
+    names: list[Optional[str]]
+
+    def __getitem__(self, state: int) -> Optional[str]:
+        return self.names[self.ids[state]]
+
+    def __len__(self) -> int:
+        return len(self.ids)
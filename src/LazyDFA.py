@@ -0,0 +1,130 @@
+from .NFA import NFA, NFABitsets, EPSILON
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class LazyDFA[STATE]:
+    # determinizes the nfa on the fly: a dfa state (a bitset of nfa states, see NFA.bitsets) and its
+    # transitions are only computed when a match reaches them, and kept in a cache of at most max_states states
+    # when the cache is full it is flushed, after max_flushes flushes during the same match the nfa is simulated
+    # directly for the rest of it (and nothing new is cached)
+    nfa: NFA[STATE]
+    max_states: int = 4096
+    max_flushes: int = 8
+
+    bits: NFABitsets[STATE] = field(init=False, repr=False)
+    # the class of every symbol (see NFABitsets.classes) and a symbol of each class, the cache has a column per class
+    columns: dict[str, int] = field(init=False, repr=False)
+    symbols: list[str] = field(init=False, repr=False)
+    # nfa states that can still reach a final state, the others are dropped from every dfa state
+    live: int = field(init=False, repr=False)
+    start: int = field(init=False, repr=False)
+    cache: dict[int, dict[int, int]] = field(default_factory=dict, init=False, repr=False)
+    tokens: dict[int, Optional[str]] = field(default_factory=dict, init=False, repr=False)
+    flushes: int = field(default=0, init=False)
+
+    def __post_init__(self) -> None:
+        self.bits = self.nfa.bitsets()
+        self.columns = {symbol: c for c, symbols in enumerate(self.bits.classes) for symbol in symbols}
+        self.symbols = [symbols[0] for symbols in self.bits.classes]
+
+        # go backwards from the final states
+        inversed_d = {}
+        for (state, symbol), next_states in self.nfa.d.items():
+            for next_state in next_states:
+                inversed_d.setdefault(next_state, set()).add(state)
+
+        alive = set(self.nfa.F)
+        queue = deque(self.nfa.F)
+        while queue:
+            state = queue.pop()
+            for prev_state in inversed_d.get(state, ()):
+                if prev_state not in alive:
+                    alive.add(prev_state)
+                    queue.append(prev_state)
+
+        self.live = 0
+        for state in alive:
+            self.live |= 1 << self.bits.index[state]
+
+        self.start = self.bits.closures[self.bits.index[self.nfa.q0]] & self.live
+
+    def flush(self) -> None:
+        self.cache.clear()
+        self.tokens.clear()
+        self.flushes = self.flushes + 1
+
+    def step(self, state: int, symbol: str) -> int:
+        # the next dfa state, 0 if nothing can be accepted anymore
+        column = self.columns.get(symbol)
+        if column is None:
+            return 0
+
+        row = self.cache.get(state)
+        if row is None:
+            if len(self.cache) >= self.max_states:
+                self.flush()
+            row = self.cache[state] = {}
+
+        next_state = row.get(column)
+        if next_state is None:
+            next_state = row[column] = self.bits.move(state, self.symbols[column]) & self.live
+        return next_state
+
+    def token(self, state: int) -> Optional[str]:
+        # cached like the transitions, at most max_states of them
+        if state in self.tokens:
+            return self.tokens[state]
+        token = self.bits.token(state)
+        if len(self.tokens) < self.max_states:
+            self.tokens[state] = token
+        return token
+
+    def accept(self, word: str) -> bool:
+        state = self.start
+        flushes = self.flushes
+
+        for symbol in word:
+            if self.flushes - flushes > self.max_flushes:
+                # the cache is thrashing
+                state = self.bits.move(state, symbol) & self.live
+            else:
+                state = self.step(state, symbol)
+
+            if not state:
+                return False
+
+        return state & self.bits.final != 0
+
+    def longest_match(self, word: str, start: int = 0) -> tuple[int, Optional[str]]:
+        # end index and token of the longest accepted (non empty) prefix of word[start:], (-1, None) if there is none
+        end, token, _ = self.scan(word, start)
+        return end, token
+
+    def scan(self, word: str, start: int = 0) -> tuple[int, Optional[str], bool]:
+        # longest_match, plus whether the dfa could still go on at the end of the word (see DenseDFA.scan)
+        final = self.bits.final
+        state = self.start
+        flushes = self.flushes
+        thrashing = False
+        end = -1
+        token = None
+
+        for j in range(start, len(word)):
+            if thrashing or self.flushes - flushes > self.max_flushes:
+                # the cache is thrashing
+                thrashing = True
+                state = self.bits.move(state, word[j]) & self.live
+            else:
+                state = self.step(state, word[j])
+
+            if not state:
+                return end, token, False
+
+            if state & final:
+                end = j + 1
+                token = self.bits.token(state) if thrashing else self.token(state)
+
+        return end, token, True
@@ -1,61 +1,530 @@
-from .Regex import Regex, parse_regex
-from .NFA import NFA
+from . import __version__
+from .Regex import Regex, ThompsonBuilder, parse_regex
+from .NFA import NFA, EPSILON
+from .DenseDFA import DenseDFA, FORMAT_VERSION
+from .LazyDFA import LazyDFA
+from .TokenEnds import TokenEnds
+from .TokenSpans import TokenSpans
 from functools import reduce
 from dataclasses import dataclass
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Iterable, Iterator
+from typing import TextIO
+import mmap
+import os
+
+# part of the cache key (see Lexer.cache_path): bump it with every change to how a spec is parsed or compiled
+# (Regex, NFA, DFA, DenseDFA) that can change the dfa of some spec, the dfas cached before are then ignored
+COMPILE_VERSION = 1
 
 class Lexer:
-    def __init__(self, spec: list[tuple[str, str]]) -> None:
+    def __init__(self, spec: list[tuple[str, str]], lazy: bool = False, cache_dir: str | None = None, skip: Iterable[str] = ()) -> None:
         self.spec = spec
         # keeps the order in the spec for some reason
         self.spec.reverse()
+        # the tokens with these names are matched like the others, but left out of the result
+        self.skip = frozenset(skip)
+
+        # the token dfa is built once and reused by every lex call
+        # with lazy=True the dfa isn't built upfront, its states are determinized while lexing (see LazyDFA)
+        # with a cache_dir the compiled dfa is saved there and loaded back by the next lexer with the same spec,
+        # nfa and dfa stay None when it was loaded
+        self.lazy = lazy
+        self.cache_dir = cache_dir
+        self.nfa = None
+        self.dfa = None
+        self.compiled = None
+        self.recompile()
+
+    def recompile(self, spec: list[tuple[str, str]] | None = None) -> None:
+        # rebuild the token dfa, call this after the spec was changed
+        # (optionally pass the new spec, it gets reversed just like in the constructor)
+        if spec is not None:
+            self.spec = spec
+            self.spec.reverse()
+
+        if self.cache_dir is not None and not self.lazy:
+            # mapped, not read: lexers of the same spec in other processes share the table
+            try:
+                compiled = DenseDFA.open(self.cache_path())
+            except (OSError, ValueError):
+                compiled = None
+
+            if compiled is not None:
+                self.nfa = None
+                self.dfa = None
+                self.compiled = compiled
+                return
+
+        # build the nfa of every regex in the same builder, they are all reachable from the new state 0
+        builder = ThompsonBuilder()
+        q0 = builder.new_state()
+        F = set()
+        Tokens = {}
+
+        for name, regex in self.spec:
+            start, finals = builder.build(parse_regex(regex))
+            builder.add(q0, EPSILON, start)
+            F = F | finals
+            for final in finals:
+                Tokens[final] = name
+
+        self.nfa = builder.nfa(q0, F, Tokens)
 
-    def lex(self, word: str) -> list[tuple[str, str]] | None:
+        if self.lazy:
+            self.dfa = None
+            self.compiled = LazyDFA(self.nfa)
+        else:
+            self.dfa = self.nfa.subset_construction().minimize()
+            self.compiled = self.dfa.compile()
+            if self.cache_dir is not None:
+                self.save_cache()
+
+    def cache_path(self) -> str:
+        # the cache file of the current spec, a new library, format or compile version invalidates it
+        # (the cache is optional, so are its imports)
+        import hashlib
+        import json
+
+        key = json.dumps([__version__, FORMAT_VERSION, COMPILE_VERSION, self.spec])
+        return os.path.join(self.cache_dir, f"lexer-{hashlib.sha256(key.encode('utf-8')).hexdigest()}.dfa")
+
+    def save_cache(self) -> None:
+        # dump writes a temporary file first so that other processes never read half of it
+        # the cache is only an optimization, failing to write it isn't an error
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.compiled.dump(self.cache_path())
+        except OSError:
+            pass
+
+    def lex(self, word: str, ends: TokenEnds | None = None) -> list[tuple[str, str]] | None:
         # this method splits the lexer into tokens based on the specification and the rules described in the lecture
         # the result is a list of tokens in the form (TOKEN_NAME:MATCHED_STRING)
 
         # if an error occurs and the lexing fails, you should return none
+        # with ends, the ends of all the tokens (the skipped ones too) are put in it for relex, unless there's an error
+
+        # a character outside of the alphabet is reported before anything else
+        unknown = self.unknown_character(word)
+        if unknown is not None:
+            return [("", f"No viable alternative at character {unknown}, line 0")]
 
-        
+        longest_match = self.compiled.longest_match
+        skip = self.skip
+        i = 0
+        ret_list = []
+        line = 0
+        all_ends = array('q')
+        kept = array('q')
 
-        # convert regex to nfa
-        nfa = []
-        for pair in self.spec:
-            nfa.append(parse_regex(pair[1]).thompson())
+        while i < len(word):
+            accept_aux, token = longest_match(word, i)
 
-        # remap states for each nfa
-        new_state_start = 1
+            if accept_aux == -1:
+                return self.error(word, i, line)
 
-        for i in range(len(nfa)):
-            nfa[i] = nfa[i].remap_states(lambda state: state - min(nfa[i].K) + new_state_start)
-            new_state_start = max(nfa[i].K) + 1
-            nfa[i].Tokens = {next(iter(nfa[i].F)): self.spec[i][0]}
+            if ends is not None:
+                all_ends.append(accept_aux)
+                kept.append(len(ret_list) + (token not in skip))
 
-        # combine nfa into an unique nfa
-        q0 = 0
-        S = set()
-        K = set({0})
-        d = {}
-        d[(0, '')] = []
-        F = set()
-        Tokens = {}
-        for aux in nfa:
-            S = S | aux.S
-            K = K | aux.K
-            d = d | aux.d
-            d[(0, '')].append(aux.q0)
-            F = F | aux.F
-            Tokens = Tokens | aux.Tokens
+            if token in skip:
+                # the new lines of a skipped token still count
+                if word.find('\n', i, accept_aux) != -1:
+                    line = line + 1
+                i = accept_aux
+                continue
 
-        unique_nfa = NFA(S, K, q0, d, F, Tokens)
+            aux_word = word[i:accept_aux]
+            ret_list.append((token, aux_word))
+            i = accept_aux
+            if '\n' in aux_word:
+                line = line + 1
 
-        lexer_dfa = unique_nfa.subset_construction()
+        if ends is not None:
+            ends.assign(all_ends, kept if skip else None)
+        return ret_list
+
+    def pool(self, processes: int | None = None) -> 'multiprocessing.pool.Pool':
+        # a pool of processes for lex_parallel, every worker gets the dfa once when it starts. a dfa loaded from the
+        # cache is mapped, the workers map the same file instead of getting a copy
+        # it can be kept and passed to lex_parallel for many words, it's closed like any pool (or in a with block)
+        import multiprocessing
+
+        compiled = self.compiled
+        if isinstance(compiled.table, memoryview):
+            compiled = self.cache_path()
+        return multiprocessing.Pool(processes, initializer=init_worker, initargs=(compiled,))
+
+    def lex_parallel(self, word: str, processes: int | None = None, chunk_size: int = 1 << 20,
+                     pool: 'multiprocessing.pool.Pool | None' = None) -> list[tuple[str, str]]:
+        # lex with a pool of processes, the result (errors included) is the same as the one of lex
+        # the word is cut into chunks of about chunk_size characters right after new lines and every chunk is lexed
+        # on its own, as if a token started there. a token whose scan reaches the end of its chunk might go on in the
+        # next one, so a chunk stops there. the results are stitched in order: as soon as the real lexing reaches a
+        # token boundary of a chunk the rest of its tokens are taken as they are, the gaps are lexed here
+        # pool is one made by self.pool, otherwise one with processes workers is made for this call
+        # lazy lexers and small words are lexed sequentially, the skipped tokens are only left out at the end
+        if self.lazy or len(word) < 2 * chunk_size or (pool is None and processes == 1):
+            return self.lex(word)
+
+        unknown = self.unknown_character(word)
+        if unknown is not None:
+            return [("", f"No viable alternative at character {unknown}, line 0")]
 
+        cuts = [0]
+        while cuts[-1] + chunk_size < len(word):
+            cut = word.find('\n', cuts[-1] + chunk_size) + 1
+            if cut <= 0 or cut >= len(word):
+                break
+            cuts.append(cut)
+        cuts.append(len(word))
+
+        tasks = [(word[cuts[k]:cuts[k + 1]], k == len(cuts) - 2) for k in range(len(cuts) - 1)]
+        if pool is None:
+            with self.pool(processes) as own_pool:
+                chunks = own_pool.map(lex_chunk, tasks)
+        else:
+            chunks = pool.map(lex_chunk, tasks)
+
+        # the lines are only counted for an error
+        longest_match = self.compiled.longest_match
         i = 0
-        j = 1
-        accept_aux = 0
+        k = 0
         ret_list = []
+
+        while i < len(word):
+            # the chunk of i, its token ends and where it stopped
+            while k + 1 < len(cuts) - 1 and cuts[k + 1] <= i:
+                k = k + 1
+            ends, tokens, stop, failed = chunks[k]
+            start = cuts[k]
+
+            # i is a boundary of the chunk if it's its start or the end of one of its tokens
+            j = bisect_left(ends, i - start)
+            if i - start <= stop and (i == start or (j < len(ends) and ends[j] == i - start)):
+                if i != start:
+                    j = j + 1
+                bounds = [i] + [start + end for end in ends[j:]]
+                ret_list.extend([(token, word[a:b]) for token, a, b in zip(tokens[j:], bounds, bounds[1:])])
+                i = bounds[-1]
+
+                if failed:
+                    return self.error(word, i, self.count_lines(ret_list))
+                if i == len(word):
+                    break
+
+            accept_aux, token = longest_match(word, i)
+            if accept_aux == -1:
+                return self.error(word, i, self.count_lines(ret_list))
+
+            ret_list.append((token, word[i:accept_aux]))
+            i = accept_aux
+
+        if self.skip:
+            return [token for token in ret_list if token[0] not in self.skip]
+        return ret_list
+
+    def lex_stream(self, source: TextIO | Iterable[str], chunk_size: int = 1 << 16) -> Iterator[tuple[str, str]]:
+        # lex a text file (anything with a read method) or an iterable of strings piece by piece, the tokens are
+        # yielded as soon as they are known and only the text after the last one is kept
+        # on an error ("", message) is yielded last. unlike lex, the tokens before the error are yielded and the
+        # message has the real line (the new lines before it) and column, counted from 1, of the character where no
+        # token starts (or EOF for the last one). a character outside of the alphabet is reported like any other
+        # error, when it's met. lex gives the same line and column as long as no token has more than one new line
+        if hasattr(source, 'read'):
+            chunks = iter(lambda: source.read(chunk_size), '')
+        else:
+            chunks = iter(source)
+
+        scan = self.compiled.scan
+        skip = self.skip
+        buffer = ''
+        exhausted = False
+        # where the buffer starts in the whole text, and the current line with its start
+        offset = 0
         line = 0
+        line_start = 0
+        i = 0
+
+        while True:
+            if not exhausted and i == len(buffer):
+                buffer = next(chunks, None)
+                if buffer is None:
+                    return
+                offset = offset + i
+                i = 0
+                continue
+
+            if i == len(buffer):
+                return
+
+            end, token, going_on = scan(buffer, i)
 
+            # the token might go on, or the text ends right after the error: read at least as much as we have,
+            # so that a long token is scanned a logarithmic number of times
+            if not exhausted and (going_on or (end == -1 and i + 1 == len(buffer))):
+                pending = [buffer[i:]]
+                size = 0
+                while size < len(pending[0]) or size == 0:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending.append(chunk)
+                    size = size + len(chunk)
+                buffer = ''.join(pending)
+                offset = offset + i
+                i = 0
+                continue
+
+            if end == -1:
+                if exhausted and i + 1 == len(buffer):
+                    yield ("", f"No viable alternative at character EOF, line {line}")
+                else:
+                    yield ("", f"No viable alternative at character {offset + i + 1 - line_start}, line {line}")
+                return
+
+            new_lines = buffer.count('\n', i, end)
+            if new_lines:
+                line = line + new_lines
+                line_start = offset + buffer.rindex('\n', i, end) + 1
+            if token not in skip:
+                yield token, buffer[i:end]
+            i = end
+
+    def relex(self, word: str, tokens: list[tuple[str, str]], offset: int, removed: int, inserted: str, ends: TokenEnds) -> list[tuple[str, str]]:
+        # lex word again after an edit: tokens were lexed from the text before it, where the removed characters at
+        # offset were replaced by inserted to get word. the result is the same as lex(word), tokens is updated in
+        # place and returned (unless there's an error, then only the error is returned)
+        # the tokens that are lexed again start at the first token whose scan reached the edit, they stop as soon as
+        # one of them ends where an old token ended after the edit: from there on the old tokens don't change
+        # ends are the end offsets of the tokens, the skipped ones too (filled by lex(word, ends) once, or
+        # TokenEnds.of(tokens) if nothing is skipped), kept by the caller and updated along with tokens: an edit doesn't
+        # go over the whole token list
+        # a lazy lexer or an error in tokens lexes the whole word, the edit isn't checked then
+        if self.lazy or (len(tokens) == 1 and tokens[0][0] == ""):
+            result = self.lex(word, ends)
+            if result and result[0][0] == "" and len(result) == 1:
+                return result
+            tokens[:] = result
+            return tokens
+
+        if not (0 <= offset <= offset + removed <= ends.length and ends.length + len(inserted) - removed == len(word)):
+            raise ValueError('the edit does not match the tokens and the word')
+        if ends.count != len(tokens) or (self.skip and ends.kept is None):
+            raise ValueError('the ends do not match the tokens')
+
+        # the text before the edit didn't have unknown characters
+        for i, symbol in enumerate(inserted):
+            if symbol not in self.compiled.columns:
+                return [("", f"No viable alternative at character {offset + i}, line 0")]
+
+        # k is the first token to lex again, the one around the edit or an earlier one whose scan got there
+        k = bisect_right(ends, offset)
+        for s in self.compiled.prefix_starts(word, offset):
+            # the token boundaries between s and the edit
+            j = bisect_left(ends, s, 0, k)
+            if s == 0:
+                k = 0
+            elif j < k and ends[j] == s:
+                k = j + 1
+
+        # from k on the old ends are stored from the end of the text, where the tokens after the edit stay
+        ends.move_gap(k)
+        relative_ends = ends.ends
+        longest_match = self.compiled.longest_match
+        skip = self.skip
+        # the skipped tokens aren't in tokens, start is where the new ones go in it
+        start = ends.kept_before(k)
+        i = ends[k - 1] if k else 0
+        new_tokens = []
+        new_ends = array('q')
+        new_kept = array('q') if ends.kept is not None else None
+        j = k
+
+        while i < len(word):
+            accept_aux, token = longest_match(word, i)
+            if accept_aux == -1:
+                # the skipped tokens with a new line count for the error but aren't in tokens
+                if skip:
+                    return self.lex(word)
+                return self.error(word, i, self.count_lines(tokens[:k]) + self.count_lines(new_tokens))
+
+            if token not in skip:
+                new_tokens.append((token, word[i:accept_aux]))
+            new_ends.append(accept_aux)
+            if new_kept is not None:
+                new_kept.append(start + len(new_tokens))
+            i = accept_aux
+
+            # past the edit, an old boundary means the rest is the same
+            if i >= offset + len(inserted):
+                j = bisect_left(relative_ends, i - len(word), j)
+                if j < len(relative_ends) and relative_ends[j] == i - len(word):
+                    tokens[start:ends.kept_before(j + 1)] = new_tokens
+                    ends.replace(k, j + 1, new_ends, len(word), len(tokens), new_kept)
+                    return tokens
+
+        tokens[start:] = new_tokens
+        ends.replace(k, len(relative_ends), new_ends, len(word), len(tokens), new_kept)
+        return tokens
+
+    def lex_spans(self, data: str | bytes | bytearray | memoryview | mmap.mmap) -> TokenSpans:
+        # lex into a TokenSpans: a kind id, a start and an end per token in arrays, nothing else is allocated for a
+        # token. data is a str or a binary buffer of utf-8 text, which is scanned in place (see lex_bytes)
+        # the tokens and errors are the ones of lex, see TokenSpans.tokens. the skipped tokens have no span, lines
+        # is the number of them with a new line
+        if isinstance(data, str):
+            source = data
+            unknown = self.unknown_character(data)
+        else:
+            source = memoryview(data).cast('B')
+            unknown = self.unknown_byte(source)
+
+        names = list(dict.fromkeys(name for name, _ in reversed(self.spec)))
+        spans = TokenSpans(source, names)
+        if unknown is not None:
+            spans.error = f"No viable alternative at character {unknown}, line 0"
+            return spans
+
+        ids = {name: kind for kind, name in enumerate(names)}
+        skipped = {ids[name] for name in self.skip if name in ids}
+        newline = '\n' if isinstance(source, str) else 10
+        lines = 0
+        kinds = spans.kinds
+        starts = spans.starts
+        ends = spans.ends
+        n = len(source)
+        i = 0
+
+        if self.lazy:
+            # the lazy dfa works on characters, i is an index in word and position the same place in source
+            word = source if isinstance(source, str) else source.tobytes().decode('utf-8')
+            same = len(word) == n
+            position = 0
+            while i < len(word):
+                end, token = self.compiled.longest_match(word, i)
+                if end == -1:
+                    break
+                end_position = end if same else position + len(word[i:end].encode('utf-8'))
+                if ids[token] in skipped:
+                    lines = lines + (newline in source[position:end_position])
+                else:
+                    kinds.append(ids[token])
+                    starts.append(position)
+                    ends.append(end_position)
+                i = end
+                position = end_position
+
+            if i < len(word):
+                spans.error = self.error(word, i, spans.newline_tokens() + lines)[0][1]
+                del kinds[:], starts[:], ends[:]
+            return spans
+
+        # every symbol is known by now, the column of a character or of a byte of a character
+        if isinstance(source, str):
+            compiled = self.compiled
+            columns = compiled.columns
+        else:
+            compiled = self.compiled.utf8()
+            columns = compiled.byte_columns()
+        state_kinds = [ids.get(token, -1) for token in compiled.tokens]
+        table = compiled.table
+        width = compiled.width
+        final = compiled.final
+
+        while i < n:
+            state = 0
+            end = -1
+            kind = -1
+            for j in range(i, n):
+                state = table[state * width + columns[source[j]]]
+                if state < 0:
+                    break
+                if final[state]:
+                    end = j + 1
+                    kind = state_kinds[state]
+
+            if end == -1:
+                break
+            if kind in skipped:
+                lines = lines + (newline in source[i:end])
+            else:
+                kinds.append(kind)
+                starts.append(i)
+                ends.append(end)
+            i = end
+
+        if i < n:
+            if isinstance(source, str):
+                word = source
+            else:
+                # the error is at the start of a character
+                word = source.tobytes().decode('utf-8')
+                i = len(source[:i].tobytes().decode('utf-8'))
+            spans.error = self.error(word, i, spans.newline_tokens() + lines)[0][1]
+            del kinds[:], starts[:], ends[:]
+
+        return spans
+
+    def lex_bytes(self, data: bytes | bytearray | memoryview | mmap.mmap) -> list[tuple[str, int, int]] | list[tuple[str, str]]:
+        # lex a binary buffer of utf-8 text without decoding or copying it, over the dfa of the bytes of the symbols
+        # (see DenseDFA.utf8). the tokens are (name, start, end) spans of data, in bytes, see materialize
+        # the tokens are the ones of lex on data.decode('utf-8') and so are the errors: their positions are in
+        # characters. a byte that isn't part of a utf-8 character is a character outside of the alphabet
+        spans = self.lex_spans(data)
+        if spans.error is not None:
+            return [("", spans.error)]
+        return list(spans)
+
+    @staticmethod
+    def materialize(data: bytes | bytearray | memoryview | mmap.mmap, spans: list[tuple[str, int, int]], encoding: str = 'utf-8') -> list[tuple[str, str]]:
+        # the (name, lexeme) tokens of lex from the spans of lex_bytes
+        view = memoryview(data).cast('B')
+        return [(token, view[start:end].tobytes().decode(encoding)) for token, start, end in spans]
+
+    def unknown_byte(self, view: memoryview) -> int | None:
+        # index (in characters) of the first character of utf-8 data outside of the alphabet, the data is decoded
+        # in blocks. a byte that isn't part of a utf-8 character becomes a lone surrogate (one character, never
+        # in the alphabet)
+        import codecs
+
+        decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+        characters = 0
+        for start in range(0, len(view), 1 << 16):
+            text = decoder.decode(view[start:start + (1 << 16)], start + (1 << 16) >= len(view))
+            unknown = self.unknown_character(text)
+            if unknown is not None:
+                return characters + unknown
+            characters = characters + len(text)
+        return None
+
+    def unknown_character(self, word: str) -> int | None:
+        # index of the first character outside of the alphabet
+        unknown = set(word) - self.compiled.columns.keys()
+        if unknown:
+            return min(word.index(symbol) for symbol in unknown)
+        return None
+
+    @staticmethod
+    def count_lines(tokens: list[tuple[str, str]]) -> int:
+        # the line of the next token, lex counts one for every token with a new line
+        return sum(1 for _, lexeme in tokens if '\n' in lexeme)
+
+    def error(self, word: str, i: int, line: int) -> list[tuple[str, str]]:
+        # no token starts at i, line is the number of tokens with a new line before it
+        if i + 1 == len(word):
+            return [("", f"No viable alternative at character EOF, line {line}")]
+        return [("", f"No viable alternative at character {i + 1 - self.line_starts(word)[line]}, line {line}")]
+
+    def longest_match(self, word: str, start: int) -> tuple[int, str | None]:
+        # end index of the longest token starting at start (or -1) and its name
+        return self.compiled.longest_match(word, start)
+
+    @staticmethod
+    def line_starts(word: str) -> list[int]:
         # create a list that saves how many characters there were in the text until the idx line
         lines = word.splitlines()
         lines_chars = [0]
@@ -63,35 +532,42 @@ class Lexer:
         while idx <= len(lines):
             lines_chars.append(lines_chars[idx - 1] + len(lines[idx - 1]) + 1)
             idx = idx + 1
+        return lines_chars
 
-        while i <= len(word) and j <= len(word):
-            aux_word = word[i:j]
-            if aux_word[-1] not in lexer_dfa.S:
-                return [("", f"No viable alternative at character {j - 1 - lines_chars[line]}, line {line}")]
-
-            ret_val = lexer_dfa.accept(aux_word)
-            if ret_val:
-                # save the idx for the last accepting word
-                accept_aux = j
-            
-            if j == len(word):
-                if accept_aux == 0:
-                    if i + 1 == len(word):
-                        return [("", f"No viable alternative at character EOF, line {line}")]
-                    return [("", f"No viable alternative at character {i + 1 - lines_chars[line]}, line {line}")]
-                else:
-                    aux_word = word[i:accept_aux]
-                    ret_list.append((lexer_dfa.accept(aux_word), aux_word))
-                    i = accept_aux
-                    j = i
-                    accept_aux = 0
-                    if '\n' in aux_word:
-                        line = line + 1
 
-            j = j + 1
+# the dfa of a worker of Lexer.pool
+worker_dfa: DenseDFA | None = None
 
 
-        return ret_list
+def init_worker(compiled: DenseDFA | str) -> None:
+    # the dfa itself or the path of a mapped one
+    global worker_dfa
+    if isinstance(compiled, str):
+        compiled = DenseDFA.open(compiled)
+    worker_dfa = compiled
+
+
+def lex_chunk(task: tuple[str, bool]) -> tuple[array, list[str], int, bool]:
+    # lex a chunk for Lexer.lex_parallel, from its start and as long as the tokens surely end inside of it
+    # returns the token ends and names, where it stopped and if it stopped because no token starts there
+    chunk, last = task
+    compiled = worker_dfa
+
+    ends = array('i')
+    tokens = []
+    i = 0
+    while i < len(chunk):
+        end, token, going_on = compiled.scan(chunk, i)
+        if going_on and not last:
+            break
+        if end == -1:
+            return ends, tokens, i, True
+
+        ends.append(end)
+        tokens.append(token)
+        i = end
+
+    return ends, tokens, i, False
 
 
 # spec = [
@@ -1,6 +1,6 @@
-from .DFA import DFA
+from .DFA import DFA, read_automaton, write_automaton
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections.abc import Callable
 from typing import Optional
 
@@ -17,13 +17,34 @@ class NFA[STATE]:
     F: set[STATE]
     Tokens: Optional[dict[STATE, str]] = None
 
+    # epsilon closure of every state computed so far (the transitions are not supposed to change afterwards)
+    closures: dict[STATE, frozenset[STATE]] = field(default_factory=dict, init=False, repr=False, compare=False)
+    bits: Optional['NFABitsets[STATE]'] = field(default=None, init=False, repr=False, compare=False)
+
+    @staticmethod
+    def load(path: str) -> 'NFA[str]':
+        # read an nfa in the text format of DFA.load, one line per transition (an empty symbol is epsilon)
+        states, initial, accepting, alphabet, transitions = read_automaton(path)
+        d = {}
+        for state, symbol, next_state in transitions:
+            d.setdefault((state, symbol), set()).add(next_state)
+        return NFA(set(alphabet) - {EPSILON}, set(states), initial, d, set(accepting))
+
+    def dump(self, path: str) -> None:
+        # write the nfa in the text format of DFA.dump, the states are written with str
+        symbols = sorted(self.S)
+        transitions = [(state, symbol, next_state) for (state, symbol), next_states in self.d.items() for next_state in next_states]
+        write_automaton(path, self.K, self.q0, self.F, symbols, transitions)
+
     def epsilon_closure(self, state: STATE) -> set[STATE]:
         # compute the epsilon closure of a state (you will need this for subset construction)
         # see the EPSILON definition at the top of this file
+        return set(self.closure(state))
 
-        # check if the state is defined
-        # if state not in self.K:
-        #     return set()
+    def closure(self, state: STATE) -> frozenset[STATE]:
+        # cached epsilon closure of a state
+        if state in self.closures:
+            return self.closures[state]
 
         reachable_states : set[STATE]
         reachable_states = set()
@@ -38,8 +59,13 @@ class NFA[STATE]:
             current_state = queue.pop()
             if current_state in reachable_states:
                 continue
-            else:
-                reachable_states.add(current_state)
+
+            # the closure of an already computed state doesn't need to be searched again
+            if current_state in self.closures:
+                reachable_states.update(self.closures[current_state])
+                continue
+
+            reachable_states.add(current_state)
 
             # check if the transition exists
             transition = (current_state, EPSILON) 
@@ -49,89 +75,136 @@ class NFA[STATE]:
                 for aux_state in next_states:
                     queue.append(aux_state)
 
-            
-        return reachable_states
+        closure = frozenset(reachable_states)
+        self.closures[state] = closure
+        return closure
+
+    def bitsets(self) -> 'NFABitsets[STATE]':
+        # dense numbering of the states with the closures and transitions as int bitsets (cached)
+        if self.bits is not None:
+            return self.bits
+
+        # every state that appears somewhere gets an index
+        states = list(self.K)
+        index = {state: i for i, state in enumerate(states)}
+        for state in [self.q0, *self.F, *(self.Tokens or {})] + [key[0] for key in self.d] + [aux for value in self.d.values() for aux in value]:
+            if state not in index:
+                index[state] = len(states)
+                states.append(state)
+
+        # only the closures of the initial state and of the targets of symbol transitions are ever needed
+        edges = [[] for _ in states]
+        needed = {index[self.q0]}
+        for (state, symbol), next_states in self.d.items():
+            if symbol == EPSILON:
+                edges[index[state]].extend(index[aux_state] for aux_state in next_states)
+            else:
+                needed.update(index[aux_state] for aux_state in next_states)
+        closures = closure_masks(edges, needed)
+
+        # for each symbol, the states that have a transition on it and where they go (epsilon closure included)
+        sources = {symbol: 0 for symbol in self.S}
+        step = {symbol: {} for symbol in self.S}
+        for (state, symbol), next_states in self.d.items():
+            if symbol == EPSILON or symbol not in step:
+                continue
+            mask = 0
+            for aux_state in next_states:
+                mask |= closures[index[aux_state]]
+            i = index[state]
+            sources[symbol] |= 1 << i
+            step[symbol][i] = step[symbol].get(i, 0) | mask
+
+        # symbols that take every state to the same place can't be told apart, each class is determinized once
+        classes = {}
+        for symbol in sorted(self.S):
+            classes.setdefault(frozenset(step[symbol].items()), []).append(symbol)
+
+        final = 0
+        for state in self.F:
+            final |= 1 << index[state]
+
+        tokens = [(1 << index[state], token) for state, token in (self.Tokens or {}).items()]
+
+        self.bits = NFABitsets(states, index, closures, sources, step, list(classes.values()), final, tokens)
+        return self.bits
+
+    def accept(self, word: str) -> bool:
+        # simulate the nfa on the word without building a dfa: the current set of states is a bitset
+        # (see bitsets) and every symbol costs one step over it, so this is O(len(word) * |K|)
+        bits = self.bitsets()
+        current_state = bits.closures[bits.index[self.q0]]
+
+        for symbol in word:
+            current_state = bits.move(current_state, symbol)
+            if not current_state:
+                return False
+
+        return current_state & bits.final != 0
 
-    def subset_construction(self) -> DFA[frozenset[STATE]]:  
+    def subset_construction(self, bitsets: bool = False) -> DFA[frozenset[STATE]] | DFA[int]:
         # convert this nfa to a dfa using the subset construction algorithm
-        # DFA
-        dfa : DFA[frozenset[STATE]]
-        
-        current_state : frozenset[STATE]
-        start_state : frozenset[STATE]
-        sink_state : frozenset[STATE]
+        # the dfa states are built as int bitsets over the nfa states (see bitsets) and only turned into
+        # frozensets at the end, pass bitsets=True to keep the ints (the sink state is 0 then)
+        bits = self.bitsets()
 
-        start_state = frozenset(self.epsilon_closure(self.q0))
-        sink_state = frozenset("sink")
+        start_state = bits.closures[bits.index[self.q0]]
+        sink_state = 0
 
-        dfa_S = self.S
         dfa_K = set()
         dfa_d = {}
-        # for symbol in self.S:
-        #     transition = (sink_state, symbol)
-        #     dfa_d[transition] = sink_state
-        dfa_q0 = start_state
         dfa_F = set()
         Tokens = {}
-        
-        for aux_F in self.F:
-            if aux_F in start_state:
-                dfa_F.add(start_state)
+
+        if start_state & bits.final:
+            dfa_F.add(start_state)
+
+        # states reached through a transition, their final state and token are computed once
+        reached = set()
 
         # queue for states
         queue = deque()
         queue.append(start_state)
+        dfa_K.add(start_state)
 
         while queue:
             current_state = queue.pop()
-            
-            if current_state in dfa_K:
-                continue
-            else:
-                dfa_K.add(current_state)
-
-            # create new states for each symbol
-            for symbol in self.S:
-                next_state = set()
 
-                # get all the next transitions for the current symbol
-                for aux_state in current_state:
-                    transition = (aux_state, symbol) 
-                    if transition in self.d:
-                        next_state.update(self.d[transition])
+            # create new states for each class of symbols
+            for symbols in bits.classes:
+                next_state = bits.move(current_state, symbols[0])
+                for symbol in symbols:
+                    dfa_d[(current_state, symbol)] = next_state
 
-                next_state_epsilon = set()
-                # get epsilon closure
-                for aux_state in next_state:
-                    next_state_epsilon.update(self.epsilon_closure(aux_state))
-                next_state.update(next_state_epsilon)
+                if next_state not in reached:
+                    reached.add(next_state)
 
-                next_state_frozen = frozenset(next_state)
-                if next_state_frozen:
-                    transition = (current_state, symbol)
-                    dfa_d[transition] = next_state_frozen
-
-                    for aux_F in self.F:
-                        if aux_F in next_state_frozen:
-                            dfa_F.add(next_state_frozen)
+                    if next_state & bits.final:
+                        dfa_F.add(next_state)
 
                     # create the new dictionary for final state - regex token
-                    if self.Tokens:
-                        for key_Token, val_token in self.Tokens.items():
-                            if key_Token in next_state_frozen:
-                                Tokens[next_state_frozen] = val_token
-
-                    queue.append(next_state_frozen)
-                else:
-                    if "sink" not in dfa_K: 
-                        for symbol_aux in self.S:
-                            transition = (sink_state, symbol_aux)
-                            dfa_d[transition] = sink_state
-                        dfa_K.add(sink_state)
-                    transition = (current_state, symbol)
-                    dfa_d[transition] = sink_state
-
-        dfa = DFA(dfa_S, dfa_K, dfa_q0, dfa_d, dfa_F, Tokens)
+                    token = bits.token(next_state)
+                    if token is not None:
+                        Tokens[next_state] = token
+
+                if next_state not in dfa_K:
+                    dfa_K.add(next_state)
+                    queue.append(next_state)
+
+        if bitsets:
+            return DFA(self.S, dfa_K, start_state, dfa_d, dfa_F, Tokens)
+
+        # back to sets of nfa states
+        frozen = {state: bits.to_frozenset(state) if state != sink_state else frozenset("sink") for state in dfa_K}
+
+        dfa = DFA(
+            self.S,
+            set(frozen.values()),
+            frozen[start_state],
+            {(frozen[state], symbol): frozen[next_state] for (state, symbol), next_state in dfa_d.items()},
+            {frozen[state] for state in dfa_F},
+            {frozen[state]: token for state, token in Tokens.items()},
+        )
         return dfa
 
     def remap_states[OTHER_STATE](self, f: 'Callable[[STATE], OTHER_STATE]') -> 'NFA[OTHER_STATE]':
@@ -158,3 +231,129 @@ class NFA[STATE]:
         new_nfa = NFA(new_S, new_K, new_q0, new_d, new_F)
 
         return new_nfa
+
+
+@dataclass
+class NFABitsets[STATE]:
+    # the states of an nfa numbered densely, a set of states is an int with bit i set for states[i]
+    states: list[STATE]
+    index: dict[STATE, int]
+    # epsilon closure of the initial state and of every target of a symbol transition
+    closures: dict[int, int]
+    # states with a transition on each symbol and, for those, the closure of their successors
+    sources: dict[str, int]
+    step: dict[str, dict[int, int]]
+    # the alphabet partitioned into symbols with identical transitions
+    classes: list[list[str]]
+    final: int
+    # (state bit, token) in the order of NFA.Tokens, the last one contained in a set wins
+    tokens: list[tuple[int, str]]
+
+    def move(self, mask: int, symbol: str) -> int:
+        # the closure of the states reached from mask on symbol
+        row = self.step.get(symbol)
+        if row is None:
+            return 0
+
+        result = 0
+        mask &= self.sources[symbol]
+        while mask:
+            low = mask & -mask
+            result |= row[low.bit_length() - 1]
+            mask ^= low
+        return result
+
+    def token(self, mask: int) -> Optional[str]:
+        for bit, token in reversed(self.tokens):
+            if mask & bit:
+                return token
+        return None
+
+    def to_frozenset(self, mask: int) -> frozenset[STATE]:
+        states = []
+        while mask:
+            low = mask & -mask
+            states.append(self.states[low.bit_length() - 1])
+            mask ^= low
+        return frozenset(states)
+
+
+def closure_masks(edges: list[list[int]], needed: set[int]) -> dict[int, int]:
+    # epsilon closures as bitsets, edges[i] are the epsilon successors of state i
+    # the states of a strongly connected component share their closure and the components come out of tarjan's
+    # algorithm successors first, so every closure is one union of already computed ones. a closure is dropped
+    # as soon as it isn't needed and every component leading to it is done
+    n = len(edges)
+    order = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    component = [-1] * n
+    components = []
+
+    counter = 0
+    for root in range(n):
+        if order[root] != -1:
+            continue
+
+        work = [(root, 0)]
+        while work:
+            state, i = work[-1]
+            if i == 0:
+                order[state] = low[state] = counter
+                counter = counter + 1
+                stack.append(state)
+                on_stack[state] = True
+
+            if i < len(edges[state]):
+                work[-1] = (state, i + 1)
+                next_state = edges[state][i]
+                if order[next_state] == -1:
+                    work.append((next_state, 0))
+                elif on_stack[next_state]:
+                    low[state] = min(low[state], order[next_state])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[state])
+
+            if low[state] == order[state]:
+                members = []
+                while True:
+                    aux_state = stack.pop()
+                    on_stack[aux_state] = False
+                    component[aux_state] = len(components)
+                    members.append(aux_state)
+                    if aux_state == state:
+                        break
+                components.append(members)
+
+    # how many edges from other components still have to read each closure
+    pending = [0] * len(components)
+    keep = [False] * len(components)
+    for state in range(n):
+        for next_state in edges[state]:
+            if component[next_state] != component[state]:
+                pending[component[next_state]] += 1
+    for state in needed:
+        keep[component[state]] = True
+
+    masks = {}
+    for c, members in enumerate(components):
+        mask = 0
+        for state in members:
+            mask |= 1 << state
+        for state in members:
+            for next_state in edges[state]:
+                other = component[next_state]
+                if other != c:
+                    mask |= masks[other]
+                    pending[other] -= 1
+                    if not pending[other] and not keep[other]:
+                        del masks[other]
+        if pending[c] or keep[c]:
+            masks[c] = mask
+
+    return {state: masks[component[state]] for state in needed}
@@ -3,6 +3,8 @@ from .NFA import NFA
 from .Regex import Regex, parse_regex
 from .Lexer import Lexer
 from dataclasses import dataclass
+from collections.abc import Iterable
+from typing import TextIO
 
 @dataclass
 class Expr:
@@ -144,8 +146,10 @@ class ClosedPar(Expr):
 @dataclass
 class Parser():
     lexer: Lexer
+    # token names the lexer matches but doesn't return
+    skip = frozenset({"Space"})
 
-    def __init__(self) -> None:
+    def __init__(self, cache_dir: str | None = None) -> None:
         spec = [
                 ("Lambda", "\\\([a-z]|[A-Z])+."),
                 ("Plus", "+"),
@@ -158,30 +162,30 @@ class Parser():
                 ("Var", "([a-z]|[A-Z])+"),
                 ("Space", "\\ ")
                 ]
-        self.lexer = Lexer(spec)
+        self.lexer = Lexer(spec, cache_dir=cache_dir, skip=self.skip)
         
     
-    def parse(self, input: str) -> None:
+    def parse(self, input: str | TextIO | Iterable[str]) -> None:
         # this method should parse the input string and print the result of the parsing process
-        
-        # get tokens in text
-        tokens_aux = self.lexer.lex(input)
+        # (input can also be a text file or pieces of text, like for Lexer.lex_stream)
 
-        # remove the space tokens, we don't need them
-        tokens = [token for token in tokens_aux if token != ("Space", " ")]
-        tokens.reverse()
+        # the tokens are lexed as they are needed, without the space tokens (see skip)
+        if isinstance(input, str):
+            input = [input]
+        tokens = self.lexer.lex_stream(input)
 
         stack = []
         cool = False
 
         while True:
             if not cool:
-                if len(tokens) == 0:
+                token = next(tokens, None)
+                if token is None:
                     break
 
-                token = tokens.pop()
-
                 match token:
+                    case ("", message):
+                        raise ValueError(message)
                     case ("Plus", "+"):
                         stack.append(PartialPlus(stack.pop()))
                     case ("Minus", "-"):
@@ -233,8 +237,8 @@ class Parser():
                 
 
             
-parser = Parser()
+# parser = Parser()
 
-print(parser.parse("\\x.\\y.(x + y)"))
+# print(parser.parse("\\x.\\y.(x + y)"))
 
 # print(Lambda(Var("x"), (Mult(Var("x"), Parens(Plus(Var("x"), Val(2)))))))
\ No newline at end of file
@@ -1,141 +1,201 @@
 from typing import Any, List
 from .NFA import NFA
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 EPSILON = ''
-current_state = 0
+
 
 class Regex:
     def thompson(self) -> NFA[int]:
-        raise NotImplementedError('the thompson method of the Regex class should never be called')
+        # every state is allocated once, in a builder shared by the whole tree
+        builder = ThompsonBuilder()
+        start, finals = builder.build(self)
+        return builder.nfa(start, finals)
+
+    def children(self) -> tuple['Regex', ...]:
+        return ()
+
+    def fragment(self, builder: 'ThompsonBuilder', parts: list[tuple[int, set[int]]]) -> tuple[int, set[int]]:
+        # add the states and transitions of this node to the builder, parts are the fragments of its children
+        # returns the start state and the final states of the fragment
+        raise NotImplementedError('the fragment method of the Regex class should never be called')
+
+
+@dataclass
+class ThompsonBuilder:
+    # the nfa being built: a state counter and a single transition store
+    S: set[str] = field(default_factory=set)
+    d: dict[tuple[int, str], set[int]] = field(default_factory=dict)
+    size: int = 0
+
+    def new_state(self) -> int:
+        self.size = self.size + 1
+        return self.size - 1
+
+    def add(self, state: int, symbol: str, next_state: int) -> None:
+        if symbol != EPSILON:
+            self.S.add(symbol)
+        self.d.setdefault((state, symbol), set()).add(next_state)
+
+    def build(self, regex: Regex) -> tuple[int, set[int]]:
+        # post order traversal with an explicit stack, the children of a node are built before it
+        fragments = []
+        stack = [(regex, False)]
+
+        while stack:
+            node, visited = stack.pop()
+            children = node.children()
+
+            if visited:
+                parts = fragments[len(fragments) - len(children):]
+                del fragments[len(fragments) - len(children):]
+                fragments.append(node.fragment(self, parts))
+            else:
+                stack.append((node, True))
+                for child in reversed(children):
+                    stack.append((child, False))
+
+        return fragments[0]
+
+    def nfa(self, start: int, finals: set[int], Tokens: dict[int, str] | None = None) -> NFA[int]:
+        return NFA(self.S, set(range(self.size)), start, self.d, finals, Tokens)
+
+    def symbol(self, symbol: str) -> tuple[int, set[int]]:
+        start_state = self.new_state()
+        end_state = self.new_state()
+        self.add(start_state, symbol, end_state)
+        return start_state, {end_state}
+
+    def concat(self, e1: tuple[int, set[int]], e2: tuple[int, set[int]]) -> tuple[int, set[int]]:
+        for final_q in e1[1]:
+            self.add(final_q, EPSILON, e2[0])
+        return e1[0], e2[1]
+
+    def char_class(self, symbols: list[str]) -> tuple[int, set[int]]:
+        # a single pair of states with one transition per symbol
+        start_state = self.new_state()
+        end_state = self.new_state()
+        for symbol in symbols:
+            self.add(start_state, symbol, end_state)
+        return start_state, {end_state}
+
+    def union(self, e1: tuple[int, set[int]], e2: tuple[int, set[int]]) -> tuple[int, set[int]]:
+        q0 = self.new_state()
+        F = self.new_state()
+
+        self.add(q0, EPSILON, e1[0])
+        self.add(q0, EPSILON, e2[0])
+        for old_F in e1[1] | e2[1]:
+            self.add(old_F, EPSILON, F)
+
+        return q0, {F}
+
+    def star(self, e: tuple[int, set[int]]) -> tuple[int, set[int]]:
+        q0 = self.new_state()
+        F = self.new_state()
+
+        self.add(q0, EPSILON, e[0])
+        self.add(q0, EPSILON, F)
+        for old_F in e[1]:
+            self.add(old_F, EPSILON, F)
+            self.add(old_F, EPSILON, e[0])
+
+        return q0, {F}
 
 
 @dataclass
 class Void(Regex):
-    
-    def thompson(self):
-        return NFA(set(), set({0}), 0, {}, set())
+
+    def fragment(self, builder, parts):
+        return builder.new_state(), set()
 
 @dataclass
 class Empty(Regex):
 
-    def thompson(self):
-        return NFA(set(), set({0}), 0, {}, set({0}))
+    def fragment(self, builder, parts):
+        state = builder.new_state()
+        return state, {state}
 
 @dataclass
 class Symbol(Regex):
     symbol: str
 
-    def thompson(self):
-        global current_state
+    def fragment(self, builder, parts):
+        return builder.symbol(self.symbol)
 
-        start_state = 0
-        end_state =  1
-
-        S = set(self.symbol)
-        K = set({start_state, end_state})
-        q0 = start_state
-        d = {(start_state, self.symbol): {end_state}}
-        F = set({end_state})
-        
-
-        return NFA(S, K, q0, d, F)
+@dataclass
+class CharClass(Regex):
+    # any one character of the ranges (a single character is a range from itself to itself)
+    # a negated class matches the characters of CHARACTER_SET outside the ranges
+    ranges: tuple[tuple[str, str], ...]
+    negated: bool = False
+
+    def symbols(self) -> list[str]:
+        symbols = set()
+        for low, high in self.ranges:
+            symbols.update(chr(c) for c in range(ord(low), ord(high) + 1))
+        if self.negated:
+            symbols = set(CHARACTER_SET) - symbols
+        return sorted(symbols)
+
+    def fragment(self, builder, parts):
+        return builder.char_class(self.symbols())
 
 @dataclass
 class Concat(Regex):
     e1: Regex
     e2: Regex
 
-    def thompson(self):
-        NFA_e1 = self.e1.thompson()
-        NFA_e2 = self.e2.thompson()
-
-        # remap states from 0 to N (number of states)
-        NFA_e1 = NFA_e1.remap_states(lambda state: state - min(NFA_e1.K))
-        NFA_e2 = NFA_e2.remap_states(lambda state: state - min(NFA_e2.K) + max(NFA_e1.K) + 1)
-
-        S = NFA_e1.S | NFA_e2.S
-        K = NFA_e1.K | NFA_e2.K
-        q0 = NFA_e1.q0
-        d = NFA_e1.d | NFA_e2.d
-
-        for final_q in NFA_e1.F:
-            d.update({(final_q, EPSILON): {NFA_e2.q0}})
-
-        F = NFA_e2.F
+    def children(self):
+        return (self.e1, self.e2)
 
-        return NFA(S, K, q0, d, F)
+    def fragment(self, builder, parts):
+        return builder.concat(parts[0], parts[1])
     
 @dataclass
 class Union(Regex):
     e1: Regex
     e2: Regex
 
-    def thompson(self):
-        NFA_e1 = self.e1.thompson()
-        NFA_e2 = self.e2.thompson()
+    def children(self):
+        return (self.e1, self.e2)
 
-        # remap states from 1 to N - 1, 0 is the new q0 and N is the new F
-        NFA_e1 = NFA_e1.remap_states(lambda state: state - min(NFA_e1.K) + 1)
-        NFA_e2 = NFA_e2.remap_states(lambda state: state - min(NFA_e2.K) + max(NFA_e1.K) + 1)
-
-        q0 = 0
-        F = {max(NFA_e2.K) + 1}
-
-        S = NFA_e1.S | NFA_e2.S
-        K = set({q0}) | NFA_e1.K | NFA_e2.K | set(F)
-        d = NFA_e1.d | NFA_e2.d
-
-        d.update({(q0, EPSILON): set({NFA_e1.q0, NFA_e2.q0})})
-
-        for old_F in NFA_e1.F | NFA_e2.F:
-            d.update({(old_F, EPSILON) : F.copy()})
-
-        return NFA(S, K, q0, d, F)
+    def fragment(self, builder, parts):
+        return builder.union(parts[0], parts[1])
 
 @dataclass
 class Star(Regex):
     e: Regex
 
-    def thompson(self):
-        NFA_e = self.e.thompson()
-
-        # remap states from 1 to N - 1, 0 is the new q0 and N is the new F
-        NFA_e = NFA_e.remap_states(lambda state: state - min(NFA_e.K) + 1)
-
-        q0 = 0
-        F = {max(NFA_e.K) + 1}
-        
+    def children(self):
+        return (self.e,)
 
-        S = NFA_e.S
-        K = set({q0}) | NFA_e.K | set(F)
-        d = NFA_e.d
-
-        d.update({(q0, EPSILON): {NFA_e.q0}})
-        d[(q0, EPSILON)].update(F)
-
-        for old_F in NFA_e.F:
-            d.update({(old_F, EPSILON): F.copy()})
-            d[(old_F, EPSILON)].update(set({NFA_e.q0}))
-
-        return NFA(S, K, q0, d, F)
+    def fragment(self, builder, parts):
+        return builder.star(parts[0])
 
 @dataclass
 class Plus(Regex):
     e: Regex
 
-    def thompson(self):
-        return Concat(self.e, Star(self.e)).thompson()
+    def children(self):
+        # e e*, the second copy gets its own states
+        return (self.e, self.e)
+
+    def fragment(self, builder, parts):
+        return builder.concat(parts[0], builder.star(parts[1]))
 
 @dataclass
 class Question(Regex):
     e: Regex
 
-    def thompson(self):
-        return Union(self.e, Symbol(EPSILON)).thompson()
+    def children(self):
+        return (self.e,)
 
+    def fragment(self, builder, parts):
+        return builder.union(parts[0], builder.symbol(EPSILON))
 
-# you should extend this class with the type constructors of regular expressions and overwrite the 'thompson' method
+
+# you should extend this class with the type constructors of regular expressions and overwrite the 'fragment' method
 # with the specific nfa patterns. for example, parse_regex('ab').thompson() should return something like:
 
 # >(0) --a--> (1) -epsilon-> (2) --b--> ((3))
@@ -143,178 +203,159 @@ class Question(Regex):
 # extra hint: you can implement each subtype of regex as a @dataclass extending Regex
     
 
-def parse_regex(regex: str) -> Regex:
-    # create a Regex object by parsing the string
+# the characters a negated class ([^...]) picks from: printable ascii, tab and new lines
+CHARACTER_SET = ''.join(chr(c) for c in range(32, 127)) + "\t\n\r"
+
+
+def parse_class(regex: str, i: int) -> tuple[CharClass, int] | None:
+    # the bracket expression starting at regex[i] == '[' and the index after it, None if it isn't closed
+    # [abc], [a-zA-Z_], [^0-9]; '-' is a plain character at the ends, white spaces are ignored unless they are
+    # escaped, like in the rest of the regex
+    i = i + 1
+    negated = False
+    if i < len(regex) and regex[i] == '^':
+        negated = True
+        i = i + 1
+
+    # escaped dashes don't make ranges
+    symbols = []
+    escaped = set()
+    while i < len(regex) and regex[i] != ']':
+        if regex[i] == '\\' and i + 1 < len(regex):
+            escaped.add(len(symbols))
+            symbols.append(regex[i + 1])
+            i = i + 2
+        elif regex[i] == ' ':
+            i = i + 1
+        else:
+            symbols.append(regex[i])
+            i = i + 1
 
-    # you can define additional classes and functions to help with the parsing process
+    if i == len(regex):
+        return None
+
+    # the dash between two characters makes a range
+    ranges = []
+    j = 0
+    while j < len(symbols):
+        if j + 2 < len(symbols) and symbols[j + 1] == '-' and j + 1 not in escaped:
+            if symbols[j] > symbols[j + 2]:
+                raise ValueError(f"Bad character range {symbols[j]}-{symbols[j + 2]}")
+            ranges.append((symbols[j], symbols[j + 2]))
+            j = j + 3
+        else:
+            ranges.append((symbols[j], symbols[j]))
+            j = j + 1
 
-    # the checker will call this function, then the thompson method of the generated object. the resulting NFA's
-    # behaviour will be checked using your implementation form stage 1
+    return CharClass(tuple(ranges), negated), i + 1
 
 
-    if not regex:
-        return Empty()
-    
-    # strip white spaces that are not before '\'
-    while regex[0] == ' ':
-        regex = regex[1:]
-
-        if not regex:
-            return Empty()
-
-    # left derivation, higher -> lower priority: *, ?, +, concat, |, ()
-    if regex[0] == '(':
-        parens = 1
-        i = 1
-
-        # check if there isn't anything after the parenthesis
-        while i < len(regex) and parens != 0:
-            if regex[i] == '(':
-                parens = parens + 1
-            if regex[i] == ')':
-                parens = parens - 1
+def tokenize_regex(regex: str) -> list[tuple[str, Any]]:
+    # split the regex into tokens: ('atom', Regex), ('op', '*' / '+' / '?'), ('|', None), ('(', None), (')', None)
+    # white spaces are ignored unless they are escaped
+    tokens = []
+    i = 0
+    n = len(regex)
+
+    while i < n:
+        c = regex[i]
+
+        if c == ' ':
+            i = i + 1
+        elif c == '\\' and i + 1 < n:
+            tokens.append(('atom', Symbol(regex[i + 1])))
+            i = i + 2
+        elif c in "*+?":
+            tokens.append(('op', c))
+            i = i + 1
+        elif c in "|()":
+            tokens.append((c, None))
+            i = i + 1
+        elif c == '[' and (char_class := parse_class(regex, i)) is not None:
+            tokens.append(('atom', char_class[0]))
+            i = char_class[1]
+        elif c == 'e' and regex[i:i + 3] == "eps":
+            tokens.append(('atom', Empty()))
+            i = i + 3
+        else:
+            tokens.append(('atom', Symbol(c)))
             i = i + 1
-        if i >= len(regex):
-            # strip the parens
-            return parse_regex(regex[1:-1])
-
-        
-        # remove white spaces after parens
-        while i < len(regex) and regex[i] == ' ':
-            regex = regex[:i] + regex[i+1:]
-
-            if i - 1 == len(regex):
-                 # strip the parens
-                return parse_regex(regex[1:-1])
-
-        if i < len(regex):
-            # check the operations in order
-            #Union
-            j = i
-            parens = 0
-            while j < len(regex):
-                if regex[j] == '(':
-                    parens = parens + 1
-                if regex[j] == ')':
-                    parens = parens - 1
-                if regex[j] == '|' and parens == 0:
-                    return Union(parse_regex(regex[0:j]), parse_regex(regex[j+1:]))
-                j = j + 1
-            
-            # Concat
-            j = i
-            while j < len(regex):
-                if regex[j] not in "?*+":
-                    return Concat(parse_regex(regex[0:j]), parse_regex(regex[j:]))
-                j = j + 1
-            
-            if i + 1 >= len(regex):
-                if regex[i] == '*':
-                    return Star(parse_regex(regex[1:i-1]))
-                if regex[i] == '?':
-                    return Question(parse_regex(regex[1:i-1]))
-                if regex[i] == '+':
-                    return Plus(parse_regex(regex[1:i-1]))
-
-    # check for escaping
-    if len(regex) > 1:
-        if regex[0] == '\\':
-            # remove white spaces after symbol
-            while len(regex) > 2 and regex[2] == ' ':
-                regex = regex[0:2] + regex[3:]
-
-                if len(regex) == 1:
-                    return Symbol(regex[0])
-
-            if len(regex) >= 3:
-                # Union
-                i = 2
-                parens = 0
-                while i < len(regex):
-                    if regex[i] == '(':
-                        parens = parens + 1
-                    if regex[i] == ')':
-                        parens = parens - 1
-                    if regex[i] == '|' and parens == 0:
-                        return Union(parse_regex(regex[:i]), parse_regex(regex[i+1:]))
-                    i = i + 1
-                
-                # Concat
-                i = 2
-                while i < len(regex):
-                    if regex[i] not in "?*+":
-                        return Concat(parse_regex(regex[:i]), parse_regex(regex[i:]))
-                    i = i + 1
- 
-            if len(regex) == 3:
-                if regex[2] == '*':
-                    return Star(Symbol(regex[1]))
-                if regex[2] == '?':
-                    return Question(Symbol(regex[1]))
-                if regex[2] == '+':
-                    return Plus(Symbol(regex[1]))
-
-            return Symbol(regex[1])
-        
-        if regex == "[A-Z]":
-            return parse_regex("A|B|C|D|E|F|G|H|I|J|K|L|M|N|O|P|Q|R|S|T|U|V|W|X|Y|Z")
-        
-        if regex == "[a-z]":
-            return parse_regex("a|b|c|d|e|f|g|h|i|j|k|l|m|n|o|p|q|r|s|t|u|v|w|x|y|z")
-        
-        if regex == "[0-9]":
-            return parse_regex("0|1|2|3|4|5|6|7|8|9")
-        
-        if regex == "eps":
-            return parse_regex("")
-
-        # check for syntactic sugars
-        i = 1
-        aux = regex[:5]
-        if len(aux) == 5 and (aux == "[A-Z]" or aux == "[a-z]" or aux == "[0-9]"):
-            i = 5
-
-        aux = regex[:3]
-        if len(aux) == 3 and aux == "eps":
-            i = 3
-        
-        j = i
-
-        # remove white spaces after symbol
-        while len(regex) > i and regex[j] == ' ':
-            regex = regex[:j] + regex[j+1:]
-
-            if len(regex) == 1:
-                return Symbol(regex[0])
-        
-        parens = 0
-        while j < len(regex):
-            if regex[j] == '(':
-                parens = parens + 1
-            if regex[j] == ')':
-                parens = parens - 1
-            if regex[j] == '|' and parens == 0:
-                return Union(parse_regex(regex[0:j]), parse_regex(regex[j+1:]))
-            if regex[j] == '\\':
-                j = j + 1
-            j = j + 1
 
-        j = i
-        while j < len(regex):
-            if regex[j] not in "?*+":
-                return Concat(parse_regex(regex[0:j]), parse_regex(regex[j:]))
-            j = j + 1
-        
-        if len(regex) == i + 1:
-            if regex[i] == '*':
-                return Star(parse_regex(regex[:i]))
-            if regex[i] == '?':
-                return Question(parse_regex(regex[:i]))
-            if regex[i] == '+':
-                return Plus(parse_regex(regex[:i]))
-        
-    
-    return Symbol(regex[0])
+    return tokens
+
+
+def concat_of(sequence: list[Regex]) -> Regex:
+    # abc... as right nested concatenations, the empty sequence is epsilon
+    if not sequence:
+        return Empty()
+
+    regex = sequence[-1]
+    for aux in reversed(sequence[:-1]):
+        regex = Concat(aux, regex)
+    return regex
+
+
+def alternatives_of(alternatives: list[Regex]) -> Regex:
+    regex = alternatives[-1]
+    for aux in reversed(alternatives[:-1]):
+        regex = Union(aux, regex)
+    return regex
+
+
+def parse_regex(regex: str) -> Regex:
+    # create a Regex object by parsing the string
+
+    # the checker will call this function, then the thompson method of the generated object. the resulting NFA's
+    # behaviour will be checked using your implementation form stage 1
+
+    # single pass over the tokens, without recursion: every open parenthesis pushes a new group on the stack
+    # a group keeps its finished alternatives and the sequence (concatenation) currently being read
+    # priority, higher -> lower: (), *, ?, +, concat, |
+    stack = []
+    alternatives = []
+    sequence = []
+
+    for kind, value in tokenize_regex(regex):
+        if kind == 'atom':
+            sequence.append(value)
+
+        elif kind == 'op':
+            if not sequence:
+                # nothing to apply it on, it's just a symbol
+                sequence.append(Symbol(value))
+            elif value == '*':
+                sequence[-1] = Star(sequence[-1])
+            elif value == '+':
+                sequence[-1] = Plus(sequence[-1])
+            else:
+                sequence[-1] = Question(sequence[-1])
+
+        elif kind == '|':
+            alternatives.append(concat_of(sequence))
+            sequence = []
+
+        elif kind == '(':
+            stack.append((alternatives, sequence))
+            alternatives = []
+            sequence = []
+
+        elif kind == ')':
+            if not stack:
+                # unmatched parenthesis
+                sequence.append(Symbol(')'))
+                continue
+
+            group = alternatives_of(alternatives + [concat_of(sequence)])
+            alternatives, sequence = stack.pop()
+            sequence.append(group)
+
+    # close the parentheses that were left open
+    while stack:
+        group = alternatives_of(alternatives + [concat_of(sequence)])
+        alternatives, sequence = stack.pop()
+        sequence.append(group)
+
+    return alternatives_of(alternatives + [concat_of(sequence)])
 
 #print(parse_regex("(ab | cd+ | b*)? efg"))
 #print(parse_regex("(ab | cd+ | b*)? efg").thompson())
@@ -0,0 +1,83 @@
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from itertools import accumulate
+from operator import itemgetter
+from typing import Optional
+
+
+@dataclass
+class TokenEnds(Sequence):
+    # the end offsets of the tokens of a text, kept next to their list between Lexer.relex calls so that an edit only
+    # costs the tokens around it. the ends of the tokens from gap on are stored relative to the end of the text
+    # (end - length): an edit changes length instead of every end after it, only moving the gap costs the tokens it
+    # goes over
+    # the skipped tokens of a lexer (see Lexer.skip) have an end too but aren't in the list, kept is then the number
+    # of tokens of the list up to every token (itself included), stored like the ends: from gap on as kept - count.
+    # without kept every token is in the list
+    ends: array = field(default_factory=lambda: array('q'))
+    length: int = 0
+    gap: int = 0
+    kept: Optional[array] = None
+    # the number of tokens of the list
+    count: int = 0
+
+    @classmethod
+    def of(cls, tokens: list[tuple[str, str]]) -> 'TokenEnds':
+        ends = cls()
+        ends.reset(tokens)
+        return ends
+
+    def reset(self, tokens: list[tuple[str, str]]) -> None:
+        # the ends of (name, lexeme) tokens, the text is their concatenation
+        self.assign(array('q', accumulate(map(len, map(itemgetter(1), tokens)))))
+
+    def assign(self, ends: array, kept: Optional[array] = None) -> None:
+        # the ends of all the tokens of a text and, if some of them are skipped, kept (see Lexer.lex)
+        self.ends = ends
+        self.length = ends[-1] if ends else 0
+        self.gap = len(ends)
+        self.kept = kept
+        if kept is None:
+            self.count = len(ends)
+        else:
+            self.count = kept[-1] if kept else 0
+
+    def __len__(self) -> int:
+        return len(self.ends)
+
+    def __getitem__(self, index: int) -> int:
+        if index < 0:
+            index = index + len(self.ends)
+        if index < self.gap:
+            return self.ends[index]
+        return self.ends[index] + self.length
+
+    def kept_before(self, index: int) -> int:
+        # the index in the list of the token index, or of the next one in it if it's skipped
+        if self.kept is None or index == 0:
+            return index
+        if index - 1 < self.gap:
+            return self.kept[index - 1]
+        return self.kept[index - 1] + self.count
+
+    def move_gap(self, gap: int) -> None:
+        for values, total in [(self.ends, self.length), (self.kept, self.count)]:
+            if values is None:
+                continue
+            for i in range(gap, self.gap):
+                values[i] = values[i] - total
+            for i in range(self.gap, gap):
+                values[i] = values[i] + total
+        self.gap = gap
+
+    def replace(self, start: int, stop: int, new_ends: array, length: int, count: int, new_kept: Optional[array] = None) -> None:
+        # the tokens start..stop-1 were replaced by tokens ending at new_ends (and with new_kept tokens of the list up
+        # to them), the text is length long now and the list has count tokens. the tokens after them kept their place
+        # from the end of the text and of the list
+        self.move_gap(start)
+        self.ends[start:stop] = array('q', [end - length for end in new_ends])
+        if self.kept is not None:
+            self.kept[start:stop] = array('q', [kept - count for kept in new_kept])
+        self.length = length
+        self.count = count
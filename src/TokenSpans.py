@@ -0,0 +1,71 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Optional
+import re
+
+
+@dataclass
+class TokenSpans(Sequence):
+    # the tokens of a lexed source as three parallel arrays: the kind of every token (an index in names), where it
+    # starts and where it ends. the lexemes are only sliced out of the source when they are asked for
+    # source is a str or a memoryview of utf-8 text (see Lexer.lex_bytes), the offsets are in its units: characters
+    # or bytes
+    # on an error the arrays are empty and error is the message of lex
+    source: str | memoryview
+    names: list[str]
+    kinds: array = field(default_factory=lambda: array('i'))
+    starts: array = field(default_factory=lambda: array('q'))
+    ends: array = field(default_factory=lambda: array('q'))
+    error: Optional[str] = None
+    # offsets of the new lines of source, see newline_offsets
+    newlines: Optional[array] = field(default=None, init=False, repr=False, compare=False)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index: int) -> tuple[str, int, int]:
+        # (name, start, end) of a token
+        return self.names[self.kinds[index]], self.starts[index], self.ends[index]
+
+    def lexeme(self, index: int) -> str:
+        if isinstance(self.source, str):
+            return self.source[self.starts[index]:self.ends[index]]
+        return self.source[self.starts[index]:self.ends[index]].tobytes().decode('utf-8')
+
+    def tokens(self) -> list[tuple[str, str]]:
+        # the (name, lexeme) list of lex
+        if self.error is not None:
+            return [("", self.error)]
+        return [(self.names[self.kinds[i]], self.lexeme(i)) for i in range(len(self.kinds))]
+
+    def newline_offsets(self) -> array:
+        # built the first time a line is asked for
+        if self.newlines is None:
+            pattern = '\n' if isinstance(self.source, str) else b'\n'
+            self.newlines = array('q', (match.start() for match in re.finditer(pattern, self.source)))
+        return self.newlines
+
+    def position(self, offset: int) -> tuple[int, int]:
+        # line and column of an offset of source, both counted from 0
+        newlines = self.newline_offsets()
+        line = bisect_left(newlines, offset)
+        if line == 0:
+            return 0, offset
+        return line, offset - newlines[line - 1] - 1
+
+    def newline_tokens(self) -> int:
+        # the number of tokens with a new line, the line of the next token for the errors of lex
+        # (the new lines between the tokens, in the skipped ones, aren't counted)
+        newlines = self.newline_offsets()
+        end = self.ends[-1] if self.ends else 0
+
+        count = 0
+        last = -1
+        for offset in newlines[:bisect_left(newlines, end)]:
+            index = bisect_right(self.ends, offset)
+            if index != last and self.starts[index] <= offset:
+                count = count + 1
+                last = index
+        return count
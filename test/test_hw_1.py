@@ -1,9 +1,14 @@
 from functools import reduce
 import itertools
+import os
+import sys
+import tempfile
 import unittest
+import unittest.mock
 from typing import Iterable
 
 from src.DFA import DFA
+from src.DenseDFA import DenseDFA
 from src.NFA import NFA
 
 
@@ -826,3 +831,290 @@ class HW1Tests(unittest.TestCase):
         )
         self.apply_test(nfa, './tests_1/test_dfa_20.txt', 9)
 
+
+    def test_compiled_dfa(self):
+        nfa = NFA(
+            {'a', 'b'},
+            {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12},
+            0,
+            {
+                (0, ''): {1, 5},
+                (1, 'a'): {2},
+                (2, 'b'): {3},
+                (3, 'b'): {4},
+                (4, ''): {12},
+                (5, 'b'): {6},
+                (6, ''): {7},
+                (7, ''): {8, 11},
+                (8, 'a'): {9},
+                (9, 'b'): {10},
+                (10, ''): {8, 11},
+                (11, ''): {12},
+            },
+            {12},
+        )
+        dfa = nfa.subset_construction()
+        compiled = dfa.compile()
+
+        # the sink state is dropped, the initial state is 0
+        self.assertEqual(compiled.size, len(dfa.K) - 1)
+        self.assertEqual(compiled.run(''), 0)
+        self.assertEqual(compiled.run('aa'), -1)
+        self.assertEqual(compiled.run('c'), -1)
+
+        for length in range(7):
+            for word in map(''.join, itertools.product('ab', repeat=length)):
+                self.assertEqual(compiled.accept(word), bool(dfa.accept(word)), word)
+
+    def test_dense_dfa_file(self):
+        dfa = DFA(
+            {'a', 'b', 'c'},
+            {0, 1, 2, 3},
+            0,
+            {
+                (0, 'a'): 1, (0, 'b'): 2, (0, 'c'): 3,
+                (1, 'a'): 1, (1, 'b'): 2, (1, 'c'): 3,
+                (2, 'a'): 3, (2, 'b'): 2, (2, 'c'): 3,
+                (3, 'a'): 3, (3, 'b'): 3, (3, 'c'): 3,
+            },
+            {1, 2},
+            {1: 'AS', 2: 'BS'},
+        )
+        compiled = dfa.compile()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'dfa.bin')
+            compiled.dump(path)
+            mapped = DenseDFA.open(path)
+
+            self.assertIsInstance(mapped.table, memoryview)
+            self.assertEqual(mapped.to_bytes(), compiled.to_bytes())
+            self.assertEqual(list(mapped.tokens), compiled.tokens)
+            for length in range(5):
+                for word in map(''.join, itertools.product('abcd', repeat=length)):
+                    self.assertEqual(mapped.accept(word), compiled.accept(word), word)
+                    self.assertEqual(mapped.longest_match(word), compiled.longest_match(word), word)
+
+            # dumping over a mapped file replaces it, the mapping keeps reading the old one
+            other = DFA({'a'}, {0, 1}, 0, {(0, 'a'): 1, (1, 'a'): 1}, {1}, {1: 'AS'}).compile()
+            other.dump(path)
+            self.assertEqual(mapped.to_bytes(), compiled.to_bytes())
+            self.assertEqual(DenseDFA.open(path).to_bytes(), other.to_bytes())
+            self.assertEqual(os.listdir(tmp_dir), ['dfa.bin'])
+            del mapped
+
+        # back to a DFA with the same language and tokens, the dead state 3 becomes the sink
+        restored = DFA.from_dense(DenseDFA.from_bytes(compiled.to_bytes()))
+        self.assertEqual(len(restored.K), 4)
+        for length in range(5):
+            for word in map(''.join, itertools.product('abc', repeat=length)):
+                # every final state has a token, so accept returns the token or False
+                self.assertEqual(restored.accept(word), dfa.accept(word), word)
+
+    def test_accept_many(self):
+        dfa = DFA(
+            {'a', 'b', 'c'},
+            {0, 1, 2, 3},
+            0,
+            {
+                (0, 'a'): 1, (0, 'b'): 2, (0, 'c'): 3,
+                (1, 'a'): 1, (1, 'b'): 2, (1, 'c'): 3,
+                (2, 'a'): 3, (2, 'b'): 2, (2, 'c'): 0,
+                (3, 'a'): 3, (3, 'b'): 3, (3, 'c'): 3,
+            },
+            {1, 2},
+            {1: 'AS'},
+        )
+        words = [''.join(word) for length in range(5) for word in itertools.product('abcd', repeat=length)]
+
+        accepted = dfa.accept_many(iter(words))
+        self.assertIsInstance(accepted, bytearray)
+        self.assertEqual(list(accepted), [int(dfa.accept(word) is not False) for word in words])
+
+        tokens = dfa.accept_many(words, tokens=True)
+        self.assertEqual(tokens[words.index('aa')], 'AS')
+        self.assertEqual(tokens[words.index('ab')], None)
+        self.assertEqual(tokens, [dfa.accept(word) if isinstance(dfa.accept(word), str) else None for word in words])
+
+        # the numpy backend and its fallback give the same results
+        words.append('abc\u20ac')
+        self.assertEqual(dfa.accept_vectorized(words), dfa.accept_many(words))
+        self.assertEqual(dfa.accept_vectorized(words, tokens=True), dfa.accept_many(words, tokens=True))
+        with unittest.mock.patch.dict(sys.modules, {'numpy': None}):
+            self.assertEqual(dfa.accept_vectorized(words, tokens=True), dfa.accept_many(words, tokens=True))
+
+    def test_load_dump(self):
+        dfa = DFA.load('./tests_1/test_dfa_2.txt')
+        ref = self.fromFile('./tests_1/test_dfa_2.txt')
+        self.assertEqual(dfa.K, {state for [state] in ref.K})
+        self.assertEqual(dfa.d, {(state, symbol): next_state for ([state], symbol), [next_state] in ref.d.items()})
+        self.assertEqual(([dfa.q0], {frozenset([state]) for state in dfa.F}), (list(ref.q0), ref.F))
+
+        compiled = DFA.load('./tests_1/test_dfa_2.txt', dense=True)
+        # built like compile does
+        built = dfa.compile()
+        self.assertEqual((compiled.size, compiled.width, compiled.columns), (built.size, built.width, built.columns))
+        nfa = NFA(
+            {'a', 'b', ' ', '\n'},
+            {0, 1, 2},
+            0,
+            {(0, ''): {1}, (1, ' '): {2}, (1, '\n'): {2}, (2, 'a'): {0}, (2, ':'): {1}, (2, '>'): {0}},
+            {0},
+        )
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'dfa.txt')
+            dfa.dump(path)
+            self.assertEqual(DFA.load(path), dfa)
+
+            path = os.path.join(tmp_dir, 'nfa.txt')
+            nfa.dump(path)
+            with open(path) as f:
+                self.assertIn('\\\\', f.read().split('#transitions')[0])
+            self.assertEqual(NFA.load(path), nfa.remap_states(str))
+
+        for length in range(6):
+            for word in map(''.join, itertools.product('ab', repeat=length)):
+                self.assertEqual(compiled.accept(word), dfa.accept(word) is not False, word)
+
+    def test_minimize_algorithms(self):
+        # 1 and 2 are equivalent, 3 ends a different token than 4
+        dfa = DFA(
+            {'a', 'b'},
+            {0, 1, 2, 3, 4, 5},
+            0,
+            {
+                (0, 'a'): 1, (0, 'b'): 2,
+                (1, 'a'): 3, (1, 'b'): 5,
+                (2, 'a'): 3, (2, 'b'): 5,
+                (3, 'a'): 5, (3, 'b'): 4,
+                (4, 'a'): 5, (4, 'b'): 5,
+                (5, 'a'): 5, (5, 'b'): 5,
+            },
+            {3, 4},
+            {3: 'AA', 4: 'AAB'},
+        )
+
+        dfa_min = dfa.minimize()
+        dfa_ref = dfa.minimize(algorithm='table')
+        self.assertEqual(len(dfa_min.K), 5)
+        self.assertEqual(len(dfa_min.K), len(dfa_ref.K))
+        self.assertEqual(dfa_min.accept('ba'), 'AA')
+        self.assertEqual(dfa_min.accept('aab'), 'AAB')
+        self.assertFalse(dfa_min.accept('aa' + 'b' * 2))
+
+        # without tokens 3 and 4 can't be merged either, they go to different states on b
+        dfa.Tokens = {}
+        self.assertEqual(len(dfa.minimize().K), 5)
+
+        with self.assertRaises(ValueError):
+            dfa.minimize(algorithm='brzozowski')
+
+    def test_symbol_classes(self):
+        # b and c are interchangeable, a isn't
+        dfa = DFA(
+            {'a', 'b', 'c'},
+            {0, 1, 2},
+            0,
+            {
+                (0, 'a'): 1, (0, 'b'): 2, (0, 'c'): 2,
+                (1, 'a'): 2, (1, 'b'): 1, (1, 'c'): 1,
+                (2, 'a'): 2, (2, 'b'): 2, (2, 'c'): 2,
+            },
+            {1},
+            {},
+        )
+        classes = dfa.symbol_classes()
+        self.assertEqual(classes['b'], classes['c'])
+        self.assertNotEqual(classes['a'], classes['b'])
+
+        compiled = dfa.compile()
+        self.assertEqual(compiled.width, 2)
+        self.assertEqual(len(compiled.table), compiled.size * 2)
+        for length in range(5):
+            for word in map(''.join, itertools.product('abc', repeat=length)):
+                self.assertEqual(compiled.accept(word), bool(dfa.accept(word)), word)
+        self.assertEqual(len(dfa.minimize().K), 3)
+
+    def test_eps_closure_cached(self):
+        nfa = NFA(
+            {'a', 'b'},
+            {0, 1, 2, 3, 4, 5, 6, 7},
+            0,
+            {
+                (0, ''): {1},
+                (1, ''): {2, 6},
+                (2, 'a'): {3},
+                (3, ''): {4},
+                (4, 'b'): {5},
+                (5, ''): {1},
+                (6, 'a'): {7},
+                (7, ''): {1}
+            },
+            {4}
+        )
+
+        self.assertEqual(nfa.closure(0), frozenset({0, 1, 2, 6}))
+        self.assertIs(nfa.closure(0), nfa.closures[0])
+
+        # the cached closure of 1 is reused by 7, callers get their own copy
+        closure = nfa.epsilon_closure(7)
+        self.assertEqual(closure, {7, 1, 2, 6})
+        closure.add(3)
+        self.assertEqual(nfa.epsilon_closure(7), {7, 1, 2, 6})
+
+        dfa = nfa.subset_construction()
+        self.assertTrue(dfa.accept('aba'))
+        self.assertFalse(dfa.accept('ab'))
+
+    def test_subset_construction_bitsets(self):
+        nfa = NFA(
+            {'a', 'b'},
+            {0, 1, 2, 3},
+            0,
+            {
+                (0, 'a'): {1},
+                (0, ''): {2},
+                (1, 'b'): {1},
+                (1, 'a'): {2},
+                (1, ''): {3},
+                (2, ''): {3},
+                (3, ''): {1},
+                (3, 'a'): {2}
+            },
+            {2},
+        )
+        dfa = nfa.subset_construction()
+        dfa_bits = nfa.subset_construction(bitsets=True)
+
+        bits = nfa.bitsets()
+        self.assertEqual(dfa_bits.q0, bits.closures[bits.index[0]])
+        self.assertEqual({bits.to_frozenset(state) for state in dfa_bits.K - {0}}, dfa.K - {frozenset('sink')})
+        self.assertEqual(len(dfa_bits.K), len(dfa.K))
+        self.assertEqual(len(dfa_bits.minimize().K), len(dfa.minimize().K))
+        self.structural_check(dfa_bits)
+        self.assertTrue(self.equivalent(dfa, dfa_bits))
+
+    def test_nfa_accept(self):
+        nfa = NFA(
+            {'1', '0'},
+            {1, 2, 3, 4, 5, 6},
+            1,
+            {
+                (1, '1'): {2},
+                (1, '0'): {5},
+                (2, ''): {4},
+                (2, '1'): {3},
+                (3, '1'): {4},
+                (5, ''): {2, 3},
+                (5, '0'): {6},
+                (6, '0'): {4}
+            },
+            {4},
+        )
+        dfa = nfa.subset_construction()
+
+        for length in range(6):
+            for word in map(''.join, itertools.product('01', repeat=length)):
+                self.assertEqual(nfa.accept(word), bool(dfa.accept(word)), word)
+
+        self.assertFalse(nfa.accept('2'))
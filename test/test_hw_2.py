@@ -5,7 +5,8 @@ import unittest
 
 from src.DFA import DFA
 from src.NFA import NFA
-from src.Regex import parse_regex
+from src.Regex import parse_regex, Concat, Union, Star, Plus, Question, Symbol, Empty, CharClass
+from src.LazyDFA import LazyDFA
 
 from typing import Iterable
 
@@ -411,4 +412,81 @@ class HW2Tests(unittest.TestCase):
         
         self.__class__.score += 3.625
 
-
+    def test_lazy_dfa(self):
+        # the full dfa would have 2^13 states
+        n = 12
+        nfa = parse_regex('(a|b)*a' + '(a|b)' * n).thompson()
+
+        lazy = LazyDFA(nfa)
+        small = LazyDFA(nfa, max_states=16, max_flushes=2)
+
+        for i in range(200):
+            word = ''.join('ab'[(i * 7 + j * j) % 3 % 2] for j in range(i % 40))
+            expected = len(word) > n and word[-n - 1] == 'a'
+            self.assertEqual(lazy.accept(word), expected, word)
+            self.assertEqual(small.accept(word), expected, word)
+
+        self.assertLessEqual(len(small.cache), 16)
+        self.assertGreater(small.flushes, 0)
+        self.assertFalse(lazy.accept('c'))
+
+        # the cap holds for the tokens too, and unknown symbols don't add states
+        for i in range(200):
+            small.longest_match(''.join('ab'[(i * 5 + j * j) % 3 % 2] for j in range(40)))
+        self.assertLessEqual(len(small.cache), 16)
+        self.assertLessEqual(len(small.tokens), 16)
+
+        fresh = LazyDFA(nfa)
+        self.assertEqual(fresh.step(fresh.start, 'c'), 0)
+        self.assertEqual(fresh.cache, {})
+
+    def test_parse_regex(self):
+        self.assertEqual(
+            parse_regex('(ab | cd+ | b*)? efg'),
+            Concat(
+                Question(Union(Concat(Symbol('a'), Symbol('b')), Union(Concat(Symbol('c'), Plus(Symbol('d'))), Star(Symbol('b'))))),
+                Concat(Symbol('e'), Concat(Symbol('f'), Symbol('g'))),
+            ),
+        )
+        self.assertEqual(parse_regex(r'\ a\*|eps'), Union(Concat(Symbol(' '), Concat(Symbol('a'), Symbol('*'))), Empty()))
+        self.assertEqual(parse_regex('[0-9]'), CharClass((('0', '9'),)))
+        self.assertEqual(parse_regex('()'), Empty())
+        self.assertEqual(parse_regex(''), Empty())
+
+        # long patterns are parsed without recursion
+        regex = parse_regex(' | '.join(f'w{i}' for i in range(5000)))
+        self.assertEqual(regex.e1, Concat(Symbol('w'), Symbol('0')))
+        self.assertEqual(parse_regex('(' * 3000 + 'a' + ')' * 3000), Symbol('a'))
+
+    def test_char_class(self):
+        self.assertEqual(parse_regex('[^a-zA-Z_]'), CharClass((('a', 'z'), ('A', 'Z'), ('_', '_')), True))
+        self.assertEqual(parse_regex(r'[\-a-]'), CharClass((('-', '-'), ('a', 'a'), ('-', '-'))))
+        self.assertEqual(parse_regex('[ab'), parse_regex(r'\[ab'))
+        with self.assertRaises(ValueError):
+            parse_regex('[z-a]')
+
+        # one pair of states instead of a union per character
+        nfa = parse_regex('[a-zA-Z_][a-zA-Z_0-9]*').thompson()
+        self.assertEqual(len(nfa.K), 6)
+        self.assertEqual(sorted(map(len, nfa.bitsets().classes)), [10, 53])
+        self.assertTrue(all(nfa.accept(word) for word in ['_a9', 'Z', 'abc_09']))
+        self.assertFalse(any(nfa.accept(word) for word in ['', '9a', 'a-b']))
+
+        nfa = parse_regex('[^0-9]+').thompson()
+        self.assertTrue(all(nfa.accept(word) for word in ['a', ' \t\n', '-_-']))
+        self.assertFalse(any(nfa.accept(word) for word in ['', 'a1', '99']))
+        self.assertEqual(bool(nfa.subset_construction().minimize().accept('x?')), nfa.accept('x?'))
+
+    def test_thompson_states(self):
+        # >(0) --a--> (1) -epsilon-> (2) --b--> ((3))
+        nfa = parse_regex('ab').thompson()
+        self.assertEqual(nfa.K, {0, 1, 2, 3})
+        self.assertEqual(nfa.d, {(0, 'a'): {1}, (1, ''): {2}, (2, 'b'): {3}})
+        self.assertEqual((nfa.q0, nfa.F), (0, {3}))
+
+        # every node allocates its states once: 2 per symbol, 2 per union
+        n = 3000
+        nfa = parse_regex('|'.join(['a'] * n)).thompson()
+        self.assertEqual(len(nfa.K), 2 * n + 2 * (n - 1))
+        self.assertTrue(nfa.accept('a'))
+        self.assertFalse(nfa.accept('aa'))
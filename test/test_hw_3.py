@@ -1,5 +1,13 @@
+import io
+import mmap
+import os
+import struct
+import tempfile
 import unittest
-from src.Lexer import Lexer
+from unittest import mock
+from src.DenseDFA import DenseDFA, HEADER
+from src.Lexer import COMPILE_VERSION, Lexer
+from src.TokenEnds import TokenEnds
 
 
 def verify(lexer: Lexer, tests):
@@ -1261,3 +1269,280 @@ class HW3Tests(unittest.TestCase):
 		print(f"test13: {results}")
 		assert all(results)
 		self.__class__.score += 15
+
+	def test_14_recompile(self):
+		lexer = Lexer([("ones", "1+"), ("zero", "0")])
+		dfa = lexer.dfa
+
+		# the token dfa is compiled once and shared by every call
+		self.assertEqual(lexer.lex("110"), [("ones", "11"), ("zero", "0")])
+		self.assertEqual(lexer.lex("011"), [("zero", "0"), ("ones", "11")])
+		self.assertIs(lexer.dfa, dfa)
+
+		lexer.recompile([("zeros", "0+"), ("one", "1")])
+		self.assertIsNot(lexer.dfa, dfa)
+		self.assertEqual(lexer.lex("1001"), [("one", "1"), ("zeros", "00"), ("one", "1")])
+
+	def test_15_long_tokens(self):
+		lexer = Lexer([("SPACE", "\\ "), ("ZEROS", "0+"), ("ONES", "1+0")])
+
+		word = "0" * 20000 + " " + "1" * 20000 + "0"
+		self.assertEqual(lexer.lex(word), [("ZEROS", "0" * 20000), ("SPACE", " "), ("ONES", "1" * 20000 + "0")])
+
+		# the scanner backtracks to the last accepting position only once
+		self.assertEqual(lexer.longest_match("0001", 0), (3, "ZEROS"))
+		self.assertEqual(lexer.longest_match("0001", 3), (-1, None))
+		self.assertEqual(lexer.lex("0 111"), [("", "No viable alternative at character 3, line 0")])
+
+	def test_16_lazy(self):
+		spec = [
+			("SPACE", "\\ "),
+			("NEWLINE", "\n"),
+			("ABC", "a(b+)c"),
+			("AS", "a+"),
+			("BCS", "(bc)+"),
+			("DORC", "(d|c)+")
+		]
+
+		lexer = Lexer(list(spec))
+		lazy_lexer = Lexer(list(spec), lazy=True)
+		self.assertIsNone(lazy_lexer.dfa)
+
+		for word in ["abbbc aaa\nbcbc dcd", "abcbcbcaabaad dccbca", "d a\nbdbc ccddabbbc", "abbcaaabc dcccabcb", "dccbcbcaaaa abbcf"]:
+			self.assertEqual(lazy_lexer.lex(word), lexer.lex(word))
+
+	def test_17_cache(self):
+		spec = [("SPACE", "\\ "), ("NEWLINE", "\n"), ("ABC", "a(b+)c"), ("AS", "a+"), ("BCS", "(bc)+"), ("DORC", "(d|c)+")]
+		words = ["abbbc aaa\nbcbc dcd", "abcbcbcaabaad dccbca", "d a\nbdbc ccddabbbc", "dccbcbcaaaa abbcf", "aaa\nb"]
+
+		with tempfile.TemporaryDirectory() as cache_dir:
+			lexer = Lexer(list(spec), cache_dir=cache_dir)
+			self.assertIsNotNone(lexer.dfa)
+			self.assertTrue(os.path.exists(lexer.cache_path()))
+
+			# the second lexer doesn't build anything
+			cached_lexer = Lexer(list(spec), cache_dir=cache_dir)
+			self.assertIsNone(cached_lexer.dfa)
+			self.assertEqual(cached_lexer.compiled.to_bytes(), lexer.compiled.to_bytes())
+			for word in words:
+				self.assertEqual(cached_lexer.lex(word), lexer.lex(word))
+
+			# a new compile version ignores the cached dfas
+			path = lexer.cache_path()
+			with mock.patch('src.Lexer.COMPILE_VERSION', COMPILE_VERSION + 1):
+				self.assertNotEqual(lexer.cache_path(), path)
+
+			# another spec gets another file
+			other_lexer = Lexer([("AS", "a+")], cache_dir=cache_dir)
+			self.assertNotEqual(other_lexer.cache_path(), lexer.cache_path())
+			self.assertIsNotNone(other_lexer.dfa)
+
+			# a damaged file is rebuilt
+			with open(lexer.cache_path(), 'wb') as f:
+				f.write(b'LPDF')
+			self.assertIsNotNone(Lexer(list(spec), cache_dir=cache_dir).dfa)
+			self.assertEqual(Lexer(list(spec), cache_dir=cache_dir).compiled.to_bytes(), lexer.compiled.to_bytes())
+
+			# so is a file with a good header but a state or a column out of range
+			data = lexer.compiled.to_bytes()
+			symbols = len(lexer.compiled.columns)
+			for offset in [HEADER.size + 8 * symbols, HEADER.size + 4 * symbols]:
+				damaged = bytearray(data)
+				damaged[offset:offset + 4] = struct.pack('<i', 1000)
+				with open(lexer.cache_path(), 'wb') as f:
+					f.write(damaged)
+				with self.assertRaises(ValueError):
+					DenseDFA.open(lexer.cache_path())
+
+				rebuilt_lexer = Lexer(list(spec), cache_dir=cache_dir)
+				self.assertIsNotNone(rebuilt_lexer.dfa)
+				for word in words:
+					self.assertEqual(rebuilt_lexer.lex(word), lexer.lex(word))
+
+		with self.assertRaises(ValueError):
+			DenseDFA.from_bytes(lexer.compiled.to_bytes()[:-3])
+
+	def test_18_parallel(self):
+		spec = [("SPACE", "\\ "), ("NEWLINE", "\n"), ("BLOCK", "\\{(a|b|\\ |\n)*\\}"), ("ABC", "a(b+)c"), ("AS", "a+"), ("BCS", "(bc)+"), ("DORC", "(d|c)+")]
+		lexer = Lexer(list(spec))
+
+		words = [
+			"abbbc aaa\nbcbc dcd\n" * 50,
+			# blocks go over the chunk boundaries
+			"aa {ab\nba\n\n b} bc\n{\n}\n" * 40,
+			# errors in the middle and at the end
+			"abc aaa\nbcbc\n" * 30 + "abd\n" + "aaa\n" * 30,
+			"abc aaa\nbcbc\n" * 30 + "{ab\n",
+			"abc aaa\nbcbc\n" * 30 + "e",
+		]
+		for word in words:
+			for chunk_size in [1, 7, 64]:
+				self.assertEqual(lexer.lex_parallel(word, processes=2, chunk_size=chunk_size), lexer.lex(word))
+
+		# one pool for many words, its workers got the dfa when they started
+		with lexer.pool(2) as pool:
+			for word in words:
+				self.assertEqual(lexer.lex_parallel(word, chunk_size=7, pool=pool), lexer.lex(word))
+
+		# a mapped dfa is opened by the workers from the cache
+		with tempfile.TemporaryDirectory() as cache_dir:
+			Lexer(list(spec), cache_dir=cache_dir)
+			cached_lexer = Lexer(list(spec), cache_dir=cache_dir)
+			self.assertIsInstance(cached_lexer.compiled.table, memoryview)
+			for word in words:
+				self.assertEqual(cached_lexer.lex_parallel(word, processes=2, chunk_size=64), lexer.lex(word))
+
+	def test_19_stream(self):
+		spec = [("SPACE", "\\ "), ("NEWLINE", "\n"), ("ABC", "a(b+)c"), ("AS", "a+"), ("BCS", "(bc)+"), ("DORC", "(d|c)+")]
+		lexer = Lexer(list(spec))
+
+		word = "abbbc aaa\nbcbc dcd\n" * 20
+		self.assertEqual(list(lexer.lex_stream(io.StringIO(word), chunk_size=3)), lexer.lex(word))
+		self.assertEqual(list(lexer.lex_stream(word[k:k + 5] for k in range(0, len(word), 5))), lexer.lex(word))
+		self.assertEqual(list(lexer.lex_stream([])), [])
+
+		# a token longer than the chunks
+		self.assertEqual(list(lexer.lex_stream(["a"] * 1000 + [" "])), [("AS", "a" * 1000), ("SPACE", " ")])
+
+		# the tokens before the error are yielded, the error is the same as the one of lex
+		for word in ["abc aaa\nbcbc abd\naaa", "abc aaa\nbcbc\nab"]:
+			tokens = list(lexer.lex_stream(io.StringIO(word), chunk_size=2))
+			self.assertEqual(tokens[-1], lexer.lex(word)[0])
+			self.assertTrue(word.startswith("".join(lexeme for _, lexeme in tokens[:-1])))
+
+		# an unknown character is reported with its real position
+		self.assertEqual(list(lexer.lex_stream(["aa\nb", "cx a"]))[-1], ("", "No viable alternative at character 3, line 1"))
+
+
+	def test_20_relex(self):
+		lexer = Lexer([("A", "a"), ("B", "abcd"), ("C", "b|c|d|e"), ("SPACE", "\\ "), ("NEWLINE", "\n")])
+
+		# the scan of the first token went up to the edit
+		tokens = lexer.lex("abce")
+		ends = TokenEnds.of(tokens)
+		self.assertEqual(lexer.relex("abcd", tokens, 3, 1, "d", ends), [("B", "abcd")])
+		self.assertEqual(tokens, [("B", "abcd")])
+		self.assertEqual(list(ends), [4])
+
+		word = "a b\nabcd e\n" * 50
+		tokens = lexer.lex(word)
+		edits = [(0, 0, "e"), (5, 4, ""), (len(word), 0, "abcd"), (100, 1, "b c"), (7, 1, "e")]
+		for offset, removed, inserted in edits:
+			new_word = word[:offset] + inserted + word[offset + removed:]
+			self.assertEqual(lexer.relex(new_word, list(tokens), offset, removed, inserted, TokenEnds.of(tokens)), lexer.lex(new_word))
+
+		# errors are the ones of lex, the tokens are left as they were
+		ends = TokenEnds.of(tokens)
+		for offset, removed, inserted in [(3, 1, "x"), (len(word), 0, "ex")]:
+			new_word = word[:offset] + inserted + word[offset + removed:]
+			self.assertEqual(lexer.relex(new_word, tokens, offset, removed, inserted, ends), lexer.lex(new_word))
+		self.assertEqual(tokens, lexer.lex(word))
+		self.assertEqual(list(ends), list(TokenEnds.of(tokens)))
+
+		# the ends kept between the edits
+		new_word = word
+		for offset, removed, inserted in [(7, 1, "e"), (8, 0, "bcd"), (0, 0, "e"), (100, 1, "b c"), (3, 5, "")]:
+			new_word = new_word[:offset] + inserted + new_word[offset + removed:]
+			self.assertEqual(lexer.relex(new_word, tokens, offset, removed, inserted, ends), lexer.lex(new_word))
+			self.assertEqual(list(ends), list(TokenEnds.of(tokens)))
+
+		# starting from an error, the whole word is lexed
+		tokens = lexer.lex(word + "x")
+		ends = TokenEnds()
+		self.assertEqual(lexer.relex(word, tokens, len(word), 1, "", ends), lexer.lex(word))
+		self.assertEqual(tokens, lexer.lex(word))
+		self.assertEqual(list(ends), list(TokenEnds.of(tokens)))
+
+		with self.assertRaises(ValueError):
+			lexer.relex(word, tokens, 0, 1, "", ends)
+
+	def test_21_bytes(self):
+		spec = [("A", "a"), ("B", "abcd"), ("C", "b|c|d|e"), ("SPACE", "\\ "), ("NEWLINE", "\n")]
+		word = "a b\nabcd e\n" * 50
+
+		for lexer in [Lexer(list(spec)), Lexer(list(spec), lazy=True)]:
+			for data in [word.encode(), bytearray(word.encode()), memoryview(word.encode())]:
+				spans = lexer.lex_bytes(data)
+				self.assertEqual(spans[:3], [("A", 0, 1), ("SPACE", 1, 2), ("C", 2, 3)])
+				self.assertEqual(lexer.materialize(data, spans), lexer.lex(word))
+
+			# errors are the ones of lex, in characters
+			for bad in ["a b\nab?d", "a b\n\u00e9"]:
+				self.assertEqual(lexer.lex_bytes(bad.encode()), lexer.lex(bad))
+			self.assertEqual(lexer.lex_bytes(b"a b\xff"), [("", "No viable alternative at character 3, line 0")])
+
+		with tempfile.TemporaryFile() as file:
+			file.write(word.encode())
+			file.flush()
+			with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				self.assertEqual(lexer.materialize(data, lexer.lex_bytes(data)), lexer.lex(word))
+
+		# the data is utf-8, the spans are in bytes
+		spec = [("E", "\u00e9+"), ("EURO", "\u20ac"), ("W", "[a-z]+"), ("SPACE", "\\ ")]
+		word = "caf\u00e9 \u20ac \u00e9\u00e9t\u00e9"
+		for lexer in [Lexer(list(spec)), Lexer(list(spec), lazy=True)]:
+			spans = lexer.lex_bytes(word.encode())
+			self.assertEqual(spans[:4], [("W", 0, 3), ("E", 3, 5), ("SPACE", 5, 6), ("EURO", 6, 9)])
+			self.assertEqual(lexer.materialize(word.encode(), spans), lexer.lex(word))
+			self.assertEqual(lexer.lex_bytes((word + "?").encode()), lexer.lex(word + "?"))
+
+	def test_22_spans(self):
+		lexer = Lexer([("A", "a"), ("B", "abcd"), ("C", "b|c|d|e"), ("SPACE", "\\ "), ("NEWLINE", "\n")])
+		word = "a b\nabcd e\n" * 50
+
+		for data in [word, word.encode()]:
+			spans = lexer.lex_spans(data)
+			self.assertEqual(len(spans), len(lexer.lex(word)))
+			self.assertEqual(spans[4], ("B", 4, 8))
+			self.assertEqual(spans.lexeme(4), "abcd")
+			self.assertEqual(spans.tokens(), lexer.lex(word))
+
+			# lines and columns from 0
+			self.assertEqual(spans.position(0), (0, 0))
+			self.assertEqual(spans.position(5), (1, 1))
+			self.assertEqual(spans.position(len(word) - 1), (99, 6))
+
+		for bad in ["a b\nab?d", "a b\nabcd ex"]:
+			spans = lexer.lex_spans(bad)
+			self.assertEqual(len(spans), 0)
+			self.assertEqual(spans.tokens(), lexer.lex(bad))
+
+		lexer = Lexer([("A", "a+b"), ("NEWLINE", "\n")], lazy=True)
+		self.assertEqual(lexer.lex_spans("ab\naab\na").tokens(), lexer.lex("ab\naab\na"))
+
+	def test_23_skip(self):
+		spec = [("A", "a"), ("B", "abcd"), ("C", "b|c|d|e"), ("SPACE", "\\ "), ("NEWLINE", "\n")]
+		full = Lexer(list(spec))
+		lexer = Lexer(list(spec), skip={"SPACE", "NEWLINE"})
+		word = "a b\nabcd e\n" * 50
+
+		tokens = [token for token in full.lex(word) if token[0] not in ("SPACE", "NEWLINE")]
+		self.assertEqual(lexer.lex(word), tokens)
+		self.assertEqual(list(lexer.lex_stream(io.StringIO(word), chunk_size=7)), tokens)
+		self.assertEqual(lexer.lex_spans(word).tokens(), tokens)
+		ends = TokenEnds()
+		self.assertEqual(lexer.relex(word + "e", lexer.lex(word, ends), len(word), 0, "e", ends), tokens + [("C", "e")])
+
+		# the ends of the skipped tokens are kept too, the edits around them are lexed again alone
+		ends = TokenEnds()
+		tokens = lexer.lex(word, ends)
+		self.assertEqual(len(ends), len(full.lex(word)))
+		for offset, removed, inserted in [(len(word) - 1, 1, " e"), (1, 1, ""), (0, 0, "a "), (20, 3, "\n"), (5, 0, "abcd b")]:
+			word = word[:offset] + inserted + word[offset + removed:]
+			self.assertEqual(lexer.relex(word, tokens, offset, removed, inserted, ends), lexer.lex(word))
+			new_ends = TokenEnds()
+			lexer.lex(word, new_ends)
+			self.assertEqual(list(ends), list(new_ends))
+			self.assertEqual([ends.kept_before(k) for k in range(len(ends) + 1)], [new_ends.kept_before(k) for k in range(len(ends) + 1)])
+
+		# the ends of a lexer that skips tokens come from lex
+		with self.assertRaises(ValueError):
+			lexer.relex(word + "e", list(tokens), len(word), 0, "e", TokenEnds.of(tokens))
+
+		# the skipped new lines still count for the errors
+		spec = [("AB", "a+b"), ("SPACE", "\\ "), ("NEWLINE", "\n")]
+		full = Lexer(list(spec))
+		lexer = Lexer(list(spec), skip={"SPACE", "NEWLINE"})
+		for bad in ["ab\n ab?", "ab\n\n aab\n a", "ab\n aab a b"]:
+			self.assertEqual(lexer.lex(bad), full.lex(bad))
+			self.assertEqual(lexer.lex_spans(bad).tokens(), full.lex(bad))
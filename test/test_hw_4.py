@@ -1,3 +1,4 @@
+import io
 import unittest
 from src.Parser import Parser
 
@@ -108,5 +109,18 @@ class HW4Test(unittest.TestCase):
         result = parser.parse(string)
         self.assertEqual(str(result), "Lambda (Var \"x\") -> Lambda (Var \"y\") -> Lambda (Var \"z\") -> Lambda (Var \"v\") -> Parant (Plus (Var \"x\") (Parant (Mult (Var \"z\") (Lambda (Var \"x\") -> Parant (Mult (Var \"x\") (Lambda (Var \"y\") -> Parant (Minus (Var \"y\") (Lambda (Var \"z\") -> Parant (Mult (Var \"z\") (Lambda (Var \"v\") -> Parant (Plus (Var \"v\") (Var \"x\"))))))))))))")
         HW4Test.score += 3
-        
-    
+
+    def test_15_stream(self):
+        parser = Parser()
+        string = "\\x.\\y.\\z.(7 + ((y * z) + (x - y)))"
+        expected = str(parser.parse(string))
+
+        # the tokens are lexed while parsing, the input can come in pieces
+        self.assertEqual(str(parser.parse(io.StringIO(string))), expected)
+        self.assertEqual(str(parser.parse([string[i:i + 3] for i in range(0, len(string), 3)])), expected)
+
+        # the error of the lexer, its column is counted from 1 like for Lexer.lex_stream
+        with self.assertRaises(ValueError) as error:
+            parser.parse("x ? y")
+        self.assertEqual(str(error.exception), "No viable alternative at character 3, line 0")
+
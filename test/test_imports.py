@@ -0,0 +1,39 @@
+import subprocess
+import sys
+import unittest
+
+
+MODULES = ['src.DFA', 'src.DenseDFA', 'src.NFA', 'src.LazyDFA', 'src.Regex', 'src.TokenEnds', 'src.TokenSpans', 'src.Lexer', 'src.Parser']
+
+# optional dependencies, they may only be imported when they are used
+OPTIONAL = ['pandas', 'numpy']
+
+
+class ImportTests(unittest.TestCase):
+    def imported_modules(self, module: str) -> tuple[list[str], str]:
+        # every module imported by `import module` (listed by -X importtime), and the output
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, check=True,
+        )
+
+        names = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            names.append(line.split('|')[-1].strip())
+        return names, result.stdout
+
+    def test_imports(self):
+        for module in MODULES:
+            names, output = self.imported_modules(module)
+
+            # no work at import time
+            self.assertEqual(output, '', module)
+            self.assertIn(module, names)
+            for name in names:
+                self.assertNotIn(name.split('.')[0], OPTIONAL, module)
+
+
+if __name__ == '__main__':
+    unittest.main()